@@ -0,0 +1,225 @@
+'''
+Agendador das consultas ao BNMP: controla o ritmo, a quantidade de consultas simultâneas, o tempo máximo de
+cada consulta e as novas tentativas, acompanhando a resposta do portal.
+
+    - ritmo: balde de fichas (token bucket) com a taxa máxima de requisições por segundo e uma pequena rajada;
+    - concorrência adaptativa (AIMD): o limite de consultas simultâneas sobe aos poucos enquanto a latência está
+      abaixo do alvo e cai pela metade em um timeout, em uma página de erro ou com a latência acima do alvo,
+      nunca passando do teto configurado;
+    - tempo máximo de cada consulta acompanhando a latência média do portal (rápido nas manhãs boas, mais folgado
+      nas lentas), dobrado a cada timeout até o máximo configurado;
+    - novas tentativas limitadas, com espera exponencial aleatória (full jitter) entre elas.
+
+Serve às sessões do navegador (threads do PoolBNMP, com executa) e ao cliente da API (laço asyncio, com
+executa_async).
+'''
+import asyncio
+import random
+import threading
+import time
+
+INTERVALO = 0.05  # intervalo (em segundos) entre as verificações de quem aguarda uma vaga
+
+
+class AgendadorBNMP:
+    '''
+    Agendador compartilhado pelas consultas ao BNMP
+    :param taxa: máximo de requisições por segundo
+    :param teto: máximo de consultas simultâneas (teto rígido, nunca ultrapassado)
+    :param concorrencia_inicial: limite de consultas simultâneas no início
+    :param latencia_alvo: latência (em segundos) abaixo da qual a concorrência pode aumentar
+    :param tentativas: máximo de tentativas de cada consulta
+    :param espera_base: espera (em segundos) antes da segunda tentativa; dobra a cada nova tentativa
+    :param espera_maxima: maior espera entre tentativas
+    :param timeout_minimo: menor tempo máximo de uma consulta
+    :param timeout_maximo: maior tempo máximo de uma consulta
+    :param e_transitorio: função (exceção) -> bool que indica as falhas que merecem nova tentativa
+    :param metricas: Metricas opcional (novas tentativas, reduções da concorrência)
+    '''
+
+    def __init__(self, taxa=2.0, teto=4, concorrencia_inicial=1, latencia_alvo=5.0, tentativas=3, espera_base=1.0,
+                 espera_maxima=30.0, timeout_minimo=8.0, timeout_maximo=60.0, e_transitorio=None, metricas=None):
+        self.taxa = taxa
+        self.teto = max(1, teto)
+        self.rajada = float(self.teto)
+        self.latencia_alvo = latencia_alvo
+        self.tentativas = max(1, tentativas)
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.timeout_minimo = timeout_minimo
+        self.timeout_maximo = timeout_maximo
+        self.e_transitorio = e_transitorio or (lambda e: True)
+        self.metricas = metricas
+
+        self.condicao = threading.Condition()
+        self.fichas = self.rajada
+        self.reabastecido_em = time.monotonic()
+        self.limite = float(min(max(1, concorrencia_inicial), self.teto))
+        self.em_andamento = 0
+        self.reduzido_em = 0.0
+        self.latencia_media = None
+        self.fator_timeout = 1.0
+        self.novas_tentativas = 0
+        self.reducoes = 0
+        self.maior_limite = int(self.limite)
+
+    # ---------------------------------
+    # Vagas (concorrência e ritmo)
+    # ---------------------------------
+    def _tenta_vaga(self) -> float:
+        '''
+        Ocupa uma vaga se houver; chamada com a condição adquirida
+        :return: 0 se a vaga foi ocupada ou o tempo (em segundos) a aguardar antes de tentar de novo
+        '''
+        if self.em_andamento >= int(self.limite):
+            return INTERVALO
+        agora = time.monotonic()
+        self.fichas = min(self.rajada, self.fichas + (agora - self.reabastecido_em) * self.taxa)
+        self.reabastecido_em = agora
+        if self.fichas < 1:
+            return (1 - self.fichas) / self.taxa
+        self.fichas -= 1
+        self.em_andamento += 1
+        return 0
+
+    def adquire(self):
+        '''
+        Aguarda (bloqueando a thread) uma vaga para uma requisição
+        '''
+        with self.condicao:
+            while True:
+                espera = self._tenta_vaga()
+                if espera == 0:
+                    return
+                self.condicao.wait(espera)
+
+    async def adquire_async(self):
+        '''
+        Aguarda, sem bloquear o laço de eventos, uma vaga para uma requisição
+        '''
+        while True:
+            with self.condicao:
+                espera = self._tenta_vaga()
+            if espera == 0:
+                return
+            await asyncio.sleep(min(espera, INTERVALO))
+
+    def libera(self, latencia, sucesso=True):
+        '''
+        Libera a vaga e ajusta o limite de concorrência e o tempo máximo das consultas
+        :param latencia: duração da requisição (em segundos); None para apenas liberar a vaga, sem ajustes
+            (requisição cancelada ou falha que não é do portal)
+        :param sucesso: False para timeout ou página de erro
+        '''
+        with self.condicao:
+            self.em_andamento -= 1
+            if latencia is None:
+                self.condicao.notify_all()
+                return
+            if sucesso:
+                self.latencia_media = latencia if self.latencia_media is None \
+                    else 0.8 * self.latencia_media + 0.2 * latencia
+                self.fator_timeout = max(1.0, self.fator_timeout / 2)
+            else:
+                self.fator_timeout = min(self.fator_timeout * 2, self.timeout_maximo / self.timeout_minimo)
+
+            if sucesso and latencia <= self.latencia_alvo:
+                # Aumento aditivo: cerca de uma vaga a mais a cada "janela" de consultas bem-sucedidas
+                self.limite = min(float(self.teto), self.limite + 1 / self.limite)
+                self.maior_limite = max(self.maior_limite, int(self.limite))
+            else:
+                self._reduz()
+            self.condicao.notify_all()
+
+    def _libera_falha(self, e, latencia):
+        # Só as falhas do portal (timeout, página de erro) ajustam o limite e o tempo máximo; as demais (ex.: um
+        # erro do programa) apenas liberam a vaga, sem contar como consulta bem-sucedida
+        self.libera(latencia if self.e_transitorio(e) else None, sucesso=False)
+
+    def _reduz(self):
+        # Redução multiplicativa, no máximo uma por intervalo de latência: as consultas que já estavam em
+        # andamento quando o portal piorou não derrubam o limite várias vezes seguidas
+        agora = time.monotonic()
+        if agora - self.reduzido_em < (self.latencia_media or self.latencia_alvo):
+            return
+        self.reduzido_em = agora
+        self.limite = max(1.0, self.limite / 2)
+        self.reducoes += 1
+        if self.metricas is not None:
+            self.metricas.conta('bnmp_reducoes_concorrencia')
+
+    # ---------------------------------
+    # Tempo máximo e novas tentativas
+    # ---------------------------------
+    def timeout(self) -> float:
+        '''
+        :return: tempo máximo (em segundos) da próxima consulta
+        '''
+        with self.condicao:
+            base = self.timeout_minimo if self.latencia_media is None else 4 * self.latencia_media
+            return min(self.timeout_maximo, max(self.timeout_minimo, base) * self.fator_timeout)
+
+    def espera_tentativa(self, tentativa) -> float:
+        '''
+        :param tentativa: número da tentativa que falhou (a partir de 1)
+        :return: espera aleatória (em segundos) antes da próxima tentativa
+        '''
+        return random.uniform(0, min(self.espera_maxima, self.espera_base * 2 ** (tentativa - 1)))
+
+    def _falhou(self, e, tentativa) -> bool:
+        '''
+        :return: True se a consulta deve ser tentada de novo
+        '''
+        if not self.e_transitorio(e) or tentativa >= self.tentativas:
+            return False
+        with self.condicao:
+            self.novas_tentativas += 1
+        if self.metricas is not None:
+            self.metricas.conta('bnmp_novas_tentativas')
+        return True
+
+    def executa(self, consulta, *args):
+        '''
+        Executa uma consulta (na thread atual) respeitando o ritmo e a concorrência, com novas tentativas
+        :param consulta: função chamada como consulta(*args, timeout=...)
+        :return: resultado da consulta; a última exceção é propagada quando as tentativas se esgotam
+        '''
+        for tentativa in range(1, self.tentativas + 1):
+            self.adquire()
+            inicio = time.perf_counter()
+            try:
+                resultado = consulta(*args, timeout=self.timeout())
+            except Exception as e:
+                self._libera_falha(e, time.perf_counter() - inicio)
+                if not self._falhou(e, tentativa):
+                    raise
+                time.sleep(self.espera_tentativa(tentativa))
+            else:
+                self.libera(time.perf_counter() - inicio)
+                return resultado
+
+    async def executa_async(self, consulta, *args):
+        '''
+        Versão de executa para corrotinas: consulta(*args, timeout=...) deve ser uma função async
+        '''
+        for tentativa in range(1, self.tentativas + 1):
+            await self.adquire_async()
+            inicio = time.perf_counter()
+            try:
+                resultado = await consulta(*args, timeout=self.timeout())
+            except asyncio.CancelledError:
+                self.libera(None)
+                raise
+            except Exception as e:
+                self._libera_falha(e, time.perf_counter() - inicio)
+                if not self._falhou(e, tentativa):
+                    raise
+                await asyncio.sleep(self.espera_tentativa(tentativa))
+            else:
+                self.libera(time.perf_counter() - inicio)
+                return resultado
+
+    def resumo(self) -> str:
+        return 'Agendador do BNMP: concorrencia final {} (maxima atingida {}, teto {}), {} reducoes, ' \
+               '{} novas tentativas'.format(int(self.limite), self.maior_limite, self.teto, self.reducoes,
+                                            self.novas_tentativas)
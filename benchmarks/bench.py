@@ -0,0 +1,205 @@
+'''
+Benchmark das etapas do popula_modelo-v1-1.py com dados sintéticos.
+
+Gera um PDF do SISPEN com o tamanho pedido, sobe o stub da API do BNMP (bnmp_stub.py) com a latência pedida e
+mede cada etapa: extração (tabula), tratamento (trata_df_pdf), mapeamento (rotas), consultas (pipeline +
+ClienteBNMP), compilação do modelo Word e renderização. O resultado pode ser gravado como linha de base e
+comparado nas execuções seguintes, acusando as etapas que ficaram mais lentas que a tolerância.
+
+Exemplos:
+    python benchmarks/bench.py --presos 600 --latencia 0.2 --salva-base benchmarks/baseline.json
+    python benchmarks/bench.py --presos 600 --latencia 0.2 --compara benchmarks/baseline.json
+'''
+from os import makedirs, path
+from time import perf_counter
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import tempfile
+
+RAIZ = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from bnmp_api import ClienteBNMP
+from bnmp_stub import inicia_em_thread
+from leiaute_pdf import detecta_colunas
+from modelo_docx import ModeloDocx
+from pipeline import PipelineEscolta
+from rotas import TabelaRotas, TABELA_ROTAS
+from sispen import extrai_pdf, trata_df_pdf
+import sinteticos
+
+ETAPAS = ['extracao', 'tratamento', 'mapeamento', 'consultas', 'compilacao', 'renderizacao']
+
+
+def mede(funcao, *args):
+    '''
+    :return: tupla (resultado da função, tempo em segundos)
+    '''
+    inicio = perf_counter()
+    resultado = funcao(*args)
+    return resultado, perf_counter() - inicio
+
+
+def confere_leiaute(pdf_path):
+    '''
+    Confere a detecção das colunas no PDF sintético: cada divisão precisa ficar à esquerda do início dos dados da
+    coluna seguinte e depois do início dos dados da coluna anterior
+    :return: lista das colunas detectadas, usadas na extração como no popula_modelo
+    '''
+    colunas = detecta_colunas(pdf_path)
+    inicios = sinteticos.X_COLUNAS
+    if not all(inicios[k - 1] < colunas[k - 1] < inicios[k] for k in range(1, len(inicios))):
+        raise RuntimeError('Colunas detectadas no PDF sintetico ({}) nao separam as colunas que comecam em {}'
+                           .format(colunas, inicios))
+    return colunas
+
+
+def consulta_todos(url, presos, rotas, concorrencia):
+    cliente = ClienteBNMP(url=url, concorrencia=concorrencia)
+    pipeline = PipelineEscolta(cliente.submete, rotas)
+    try:
+        return asyncio.run(pipeline.executa(presos))
+    finally:
+        cliente.encerra()
+
+
+def executa(args, dir_trabalho) -> dict:
+    '''
+    Executa as repetições do benchmark
+    :return: dict com os parametros, o ambiente e os tempos de cada etapa
+    '''
+    tabela_rotas = TabelaRotas(args.tabela_rotas)
+    lista = sinteticos.gera_presos(tabela_rotas.tabela['delegacia'].tolist(), n_presos=args.presos,
+                                   taxa_repetidos=args.repetidos, seed=args.seed)
+    paginas = sinteticos.monta_paginas(lista, linhas_por_pagina=args.linhas_por_pagina)
+    pdf_path = path.join(dir_trabalho, 'sispen.pdf')
+    modelo = path.join(dir_trabalho, 'modelo.docx')
+    sinteticos.escreve_pdf(paginas, pdf_path, cabecalho_centralizado=args.cabecalho_centralizado)
+    colunas = confere_leiaute(pdf_path)
+    sinteticos.escreve_modelo(sorted(tabela_rotas.tabela['posto'].unique()), modelo)
+    rotas = sorted(tabela_rotas.tabela['rota'].unique())
+
+    stub = inicia_em_thread(sinteticos.respostas_bnmp(lista, seed=args.seed), latencia=args.latencia)
+    amostras = {etapa: [] for etapa in ETAPAS}
+    try:
+        for _ in range(args.repeticoes):
+            if args.sem_tabula:
+                dfs = sinteticos.paginas_em_dfs(paginas)
+            else:
+                dfs, tempo = mede(extrai_pdf, pdf_path, colunas, args.pdf_workers)
+                amostras['extracao'].append(tempo)
+
+            df, tempo = mede(trata_df_pdf, dfs)
+            amostras['tratamento'].append(tempo)
+            df, tempo = mede(tabela_rotas.mapeia, df)
+            amostras['mapeamento'].append(tempo)
+            if len(df) != args.presos:
+                raise RuntimeError('Tratamento do PDF sintetico devolveu {} presos, eram esperados {}'
+                                   .format(len(df), args.presos))
+
+            linhas_dp, tempo = mede(consulta_todos, stub.url, df.to_dict(orient='records'), rotas,
+                                    args.concorrencia)
+            amostras['consultas'].append(tempo)
+
+            documento, tempo = mede(ModeloDocx, modelo, None)
+            amostras['compilacao'].append(tempo)
+            _, tempo = mede(documento.renderiza, path.join(dir_trabalho, 'saida.docx'),
+                            {'nome_agente': 'Benchmark'}, linhas_dp)
+            amostras['renderizacao'].append(tempo)
+    finally:
+        stub.shutdown()
+
+    return {
+        'parametros': {'presos': args.presos, 'linhas_por_pagina': args.linhas_por_pagina,
+                       'repetidos': args.repetidos, 'seed': args.seed, 'latencia': args.latencia,
+                       'concorrencia': args.concorrencia, 'pdf_workers': args.pdf_workers,
+                       'sem_tabula': args.sem_tabula, 'cabecalho_centralizado': args.cabecalho_centralizado},
+        'dados': {'paginas': len(paginas), 'delegacias': len(lista), 'colunas': colunas,
+                  'quebras_no_meio': sinteticos.quebras_no_meio(paginas), 'consultas_stub': stub.consultas},
+        'ambiente': {'python': platform.python_version(), 'plataforma': platform.platform()},
+        'etapas': {etapa: {'mediana': statistics.median(tempos), 'minimo': min(tempos), 'amostras': tempos}
+                   for etapa, tempos in amostras.items() if len(tempos) > 0},
+    }
+
+
+def compara(resultado, base, tolerancia, folga=0.01) -> list:
+    '''
+    Compara as medianas de cada etapa com a linha de base
+    :param folga: diferença absoluta, em segundos, abaixo da qual a variação é tratada como ruído
+    :return: lista das etapas mais lentas que base * (1 + tolerancia)
+    '''
+    if resultado['parametros'] != base['parametros']:
+        print('Atencao: parametros diferentes da linha de base: {}'.format(base['parametros']), end='\n')
+
+    regressoes = []
+    print('{:<14}{:>12}{:>12}{:>10}'.format('etapa', 'base (s)', 'atual (s)', 'razao'), end='\n')
+    for etapa, tempos in resultado['etapas'].items():
+        if etapa not in base['etapas']:
+            continue
+        anterior = base['etapas'][etapa]['mediana']
+        razao = tempos['mediana'] / anterior if anterior > 0 else float('inf')
+        marca = '  <- regressao' if razao > 1 + tolerancia and tempos['mediana'] - anterior > folga else ''
+        print('{:<14}{:>12.4f}{:>12.4f}{:>10.2f}{}'.format(etapa, anterior, tempos['mediana'], razao, marca),
+              end='\n')
+        if marca:
+            regressoes.append(etapa)
+    return regressoes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark das etapas do popula_modelo com dados sinteticos')
+    parser.add_argument("--presos", type=int, default=600, help="quantidade de presos no PDF sintetico")
+    parser.add_argument("--linhas-por-pagina", type=int, default=40,
+                        help="linhas por pagina do PDF (menos linhas, mais paginas e quebras no meio das delegacias)")
+    parser.add_argument("--repetidos", type=float, default=0.05, help="fracao de presos listados mais de uma vez")
+    parser.add_argument("--seed", type=int, default=1, help="semente dos dados sinteticos")
+    parser.add_argument("--latencia", type=float, default=0.2, help="latencia em segundos do stub do BNMP")
+    parser.add_argument("--concorrencia", type=int, default=4, help="consultas simultaneas ao stub do BNMP")
+    parser.add_argument("--pdf-workers", type=int, default=1, help="extracoes simultaneas do tabula")
+    parser.add_argument("--repeticoes", type=int, default=3, help="quantidade de repeticoes de cada etapa")
+    parser.add_argument("--tabela-rotas", default=TABELA_ROTAS, help="CSV delegacia -> posto -> rota")
+    parser.add_argument("--sem-tabula", action='store_true',
+                        help="nao mede a extracao (sem Java): o tratamento recebe as paginas sinteticas prontas")
+    parser.add_argument("--cabecalho-centralizado", action='store_true',
+                        help="centraliza os rotulos do cabecalho da tabela no PDF sintetico (conferencia da deteccao "
+                             "das colunas)")
+    parser.add_argument("--salva-base", help="grava o resultado como linha de base neste arquivo JSON")
+    parser.add_argument("--compara", help="compara o resultado com a linha de base gravada neste arquivo JSON")
+    parser.add_argument("--tolerancia", type=float, default=0.2,
+                        help="aumento relativo do tempo de uma etapa aceito antes de acusar regressao")
+    parser.add_argument("--folga", type=float, default=0.01,
+                        help="diferenca absoluta em segundos abaixo da qual a variacao de uma etapa e ignorada")
+    parser.add_argument("--dir-dados",
+                        help="grava o PDF, o modelo e o documento gerados neste diretorio (padrao: temporario)")
+    args = parser.parse_args()
+    if args.compara and not path.exists(args.compara):
+        print('Linha de base {} nao encontrada; grave-a nesta maquina com --salva-base {}'.format(
+            args.compara, args.compara), end='\n')
+        sys.exit(2)
+
+    if args.dir_dados:
+        makedirs(args.dir_dados, exist_ok=True)
+        resultado = executa(args, args.dir_dados)
+    else:
+        with tempfile.TemporaryDirectory() as dir_trabalho:
+            resultado = executa(args, dir_trabalho)
+
+    print(json.dumps({'dados': resultado['dados'],
+                      'etapas': {etapa: round(tempos['mediana'], 4) for etapa, tempos in resultado['etapas'].items()}},
+                     indent=2), end='\n')
+
+    if args.salva_base:
+        with open(args.salva_base, 'w', encoding='utf-8') as arq:
+            json.dump(resultado, arq, indent=2)
+        print('Linha de base gravada em {}'.format(args.salva_base), end='\n')
+
+    if args.compara:
+        with open(args.compara, encoding='utf-8') as arq:
+            regressoes = compara(resultado, json.load(arq), args.tolerancia, args.folga)
+        if len(regressoes) > 0:
+            print('Etapas mais lentas que a linha de base: {}'.format(', '.join(regressoes)), end='\n')
+            sys.exit(1)
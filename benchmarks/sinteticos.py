@@ -0,0 +1,252 @@
+'''
+Geração de dados sintéticos para os benchmarks: PDF do SISPEN, modelo Word e respostas do BNMP.
+
+O PDF segue o leiaute da lista de escolta lida pelo tabula com columns=[325, 500, 600, 700, 800, 900]: uma linha
+de título por página (que o tabula usa como cabeçalho do DataFrame), e para cada delegacia a linha
+"Delegacia : Xa DP", o cabeçalho "Nome do Preso", os presos e o totalizador. As listas continuam na página
+seguinte quando não cabem na página (quebras de página no meio de uma delegacia).
+
+O PDF é escrito diretamente (sem bibliotecas), com a fonte Helvetica padrão em WinAnsiEncoding.
+'''
+from datetime import date, timedelta
+from zipfile import ZipFile
+import random
+
+import numpy as np
+import pandas as pd
+
+# Posição x (em pontos) do início de cada coluna e largura disponível até a divisão seguinte
+X_COLUNAS = [20, 330, 505, 605, 705]
+LARGURA_COLUNAS = [300, 165, 90, 90, 90]
+CABECALHO = ['Nome do Preso', 'Nome da Mãe', 'Nascimento', 'Ocorrência', 'Cadastro']
+TITULOS = ['POLICIA CIVIL', 'DEPARTAMENTO DE POLICIA ESPECIALIZADA', 'DCCP - DIVISAO DE CAPTURAS',
+           'RELATORIO DE SOLICITACOES DE ESCOLTA']
+
+LARGURA_PAGINA = 1008
+ALTURA_PAGINA = 612
+TAMANHO_FONTE = 7
+ALTURA_LINHA = 12
+LARGURA_CARACTERE = 0.7 * TAMANHO_FONTE  # estimativa folgada para as maiúsculas da Helvetica
+
+PRENOMES = ['JOSÉ', 'JOÃO', 'ANTÔNIO', 'FRANCISCO', 'CARLOS', 'PAULO', 'PEDRO', 'LUCAS', 'LUIZ', 'MARCOS',
+            'GABRIEL', 'RAFAEL', 'DANIEL', 'MARCELO', 'BRUNO', 'EDUARDO', 'FELIPE', 'RAIMUNDO', 'RODRIGO',
+            'MATHEUS', 'WESLEY', 'FÁBIO', 'GILSON', 'KLEBER', 'LAUANE', 'WANDERSON', 'DEYVID', 'EDVAN']
+PRENOMES_MAE = ['MARIA', 'ANA', 'FRANCISCA', 'ANTÔNIA', 'ADRIANA', 'JULIANA', 'MÁRCIA', 'FERNANDA', 'PATRÍCIA',
+                'ALINE', 'SANDRA', 'TEREZINHA', 'LUSILENE', 'JOSEFA', 'ELIZABETE', 'VANDERLUCE', 'IZAURI']
+SOBRENOMES = ['SILVA', 'SANTOS', 'OLIVEIRA', 'SOUZA', 'RODRIGUES', 'FERREIRA', 'ALVES', 'PEREIRA', 'LIMA',
+              'GOMES', 'COSTA', 'RIBEIRO', 'MARTINS', 'CARVALHO', 'ALMEIDA', 'LOPES', 'SOARES', 'ARAÚJO',
+              'CALÓ', 'CONCEIÇÃO', 'DOURADO', 'BATISTA', 'NASCIMENTO', 'SAMPAIO', 'JARDIM']
+
+
+def _nome(rnd, prenomes):
+    partes = [rnd.choice(prenomes)] + [rnd.choice(SOBRENOMES) for _ in range(rnd.randint(1, 3))]
+    if rnd.random() < 0.3:
+        partes.insert(-1, rnd.choice(['DA', 'DE', 'DOS']))
+    return ' '.join(partes)
+
+
+def _cabe(texto, coluna):
+    return texto[:int(LARGURA_COLUNAS[coluna] / LARGURA_CARACTERE)]
+
+
+def gera_presos(delegacias, n_presos=600, taxa_repetidos=0.05, taxa_sem_nascimento=0.03, seed=1) -> list:
+    '''
+    Funcao que sorteia a lista de presos de cada delegacia
+    :param delegacias: nomes das delegacias (ex.: coluna delegacia do rotas.csv)
+    :param n_presos: quantidade total de presos
+    :param taxa_repetidos: fração de presos repetidos (mesmo preso listado de novo, em outra delegacia)
+    :param taxa_sem_nascimento: fração de presos sem data de nascimento
+    :param seed: semente do sorteio (a mesma semente gera a mesma lista)
+    :return: lista de tuplas (delegacia, [linhas de 5 colunas]), na ordem do PDF
+    '''
+    rnd = random.Random(seed)
+    inicio = date(2021, 3, 1)
+    lista = {delegacia: [] for delegacia in delegacias}
+    gerados = []
+    for i in range(n_presos):
+        delegacia = rnd.choice(delegacias)
+        if len(gerados) > 0 and rnd.random() < taxa_repetidos:
+            linha = list(rnd.choice(gerados))
+        else:
+            nome = _nome(rnd, PRENOMES)
+            if rnd.random() < 0.4:
+                nome += ' (Prt.: {})'.format(rnd.randint(1000, 160000))
+            nascimento = None if rnd.random() < taxa_sem_nascimento else \
+                '{:%d/%m/%Y}'.format(inicio - timedelta(days=rnd.randint(18 * 365, 60 * 365)))
+            linha = [nome, _nome(rnd, PRENOMES_MAE), nascimento,
+                     'IP {}/2021 {}'.format(rnd.randint(1, 999), delegacia.replace(' ', '')),
+                     '{:%d/%m/%Y %H:%M}'.format(inicio + timedelta(minutes=rnd.randint(0, 1440)))]
+            gerados.append(linha)
+        lista[delegacia].append([_cabe(valor, c) if valor else valor for c, valor in enumerate(linha)])
+    return [(delegacia, presos) for delegacia, presos in lista.items() if len(presos) > 0]
+
+
+def monta_paginas(lista, linhas_por_pagina=40) -> list:
+    '''
+    Funcao que distribui as linhas do relatório pelas páginas
+    :param lista: saída de gera_presos
+    :param linhas_por_pagina: quantidade de linhas de cada página, além da linha de título
+    :return: lista de páginas, cada uma uma lista de linhas de 5 colunas (None nas colunas vazias)
+    '''
+    linhas = [[titulo, None, None, None, None] for titulo in TITULOS]
+    for delegacia, presos in lista:
+        linhas.append(['Delegacia : ' + delegacia, None, None, None, None])
+        linhas.append(list(CABECALHO))
+        linhas.extend(presos)
+        linhas.append(['Total de presos para escolta na Delegacia : {}'.format(len(presos)),
+                       None, None, None, None])
+
+    paginas = []
+    for inicio in range(0, len(linhas), linhas_por_pagina):
+        n = len(paginas) + 1
+        paginas.append([[None, None, None, None, 'Pagina {}'.format(n)]] + linhas[inicio:inicio + linhas_por_pagina])
+    return paginas
+
+
+def quebras_no_meio(paginas) -> int:
+    '''
+    :return: quantidade de páginas que começam no meio da lista de uma delegacia
+    '''
+    total = 0
+    for anterior, pagina in zip(paginas, paginas[1:]):
+        ultima = [linha[0] for linha in anterior if linha[0]][-1]
+        primeira = pagina[1][0] or ''
+        if not (ultima.startswith('Total de presos') or primeira.startswith('Delegacia')):
+            total += 1
+    return total
+
+
+def paginas_em_dfs(paginas) -> list:
+    '''
+    Funcao que monta a lista de DataFrames equivalente à do tabula.read_pdf para as páginas sintéticas (a linha
+    de título vira o cabeçalho do DataFrame), para medir o tratamento sem depender do Java
+    :return: lista de DataFrames, um por página
+    '''
+    dfs = []
+    for pagina in paginas:
+        colunas = [valor if valor else 'Unnamed: {}'.format(c) for c, valor in enumerate(pagina[0])]
+        df = pd.DataFrame(pagina[1:], columns=colunas)
+        dfs.append(df.where(df.notna(), np.nan))
+    return dfs
+
+
+def _texto_pdf(texto) -> str:
+    dados = texto.encode('cp1252', 'replace').decode('latin-1')
+    return dados.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def escreve_pdf(paginas, destino, cabecalho_centralizado=False):
+    '''
+    Funcao que grava as páginas em um arquivo PDF
+    :param paginas: saída de monta_paginas
+    :param destino: caminho do PDF gerado
+    :param cabecalho_centralizado: centraliza os rótulos do cabeçalho da tabela nas colunas (os dados continuam
+        alinhados à esquerda)
+    '''
+    objetos = []  # conteúdo de cada objeto, numerados a partir de 1
+
+    def novo(conteudo=b''):
+        objetos.append(conteudo)
+        return len(objetos)
+
+    catalogo = novo()
+    raiz_paginas = novo()
+    fonte = novo(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+
+    ids_paginas = []
+    for pagina in paginas:
+        comandos = ['BT', '/F1 {} Tf'.format(TAMANHO_FONTE)]
+        y = ALTURA_PAGINA - 30
+        for linha in pagina:
+            for c, valor in enumerate(linha):
+                if valor:
+                    x = X_COLUNAS[c]
+                    if cabecalho_centralizado and linha == CABECALHO:
+                        x += round((LARGURA_COLUNAS[c] - len(valor) * LARGURA_CARACTERE) / 2, 1)
+                    comandos.append('1 0 0 1 {} {} Tm ({}) Tj'.format(x, y, _texto_pdf(valor)))
+            y -= ALTURA_LINHA
+        comandos.append('ET')
+        fluxo = '\n'.join(comandos).encode('latin-1')
+        conteudo = novo(b'<< /Length %d >>\nstream\n' % len(fluxo) + fluxo + b'\nendstream')
+        ids_paginas.append(novo('<< /Type /Page /Parent {} 0 R /MediaBox [0 0 {} {}] /Contents {} 0 R '
+                                '/Resources << /Font << /F1 {} 0 R >> >> >>'
+                                .format(raiz_paginas, LARGURA_PAGINA, ALTURA_PAGINA, conteudo, fonte)
+                                .encode('ascii')))
+
+    objetos[catalogo - 1] = '<< /Type /Catalog /Pages {} 0 R >>'.format(raiz_paginas).encode('ascii')
+    objetos[raiz_paginas - 1] = '<< /Type /Pages /Kids [{}] /Count {} >>'.format(
+        ' '.join('{} 0 R'.format(i) for i in ids_paginas), len(ids_paginas)).encode('ascii')
+
+    with open(destino, 'wb') as arq:
+        arq.write(b'%PDF-1.4\n')
+        posicoes = []
+        for i, conteudo in enumerate(objetos, start=1):
+            posicoes.append(arq.tell())
+            arq.write(b'%d 0 obj\n' % i + conteudo + b'\nendobj\n')
+        inicio_xref = arq.tell()
+        arq.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objetos) + 1))
+        for posicao in posicoes:
+            arq.write(b'%010d 00000 n \n' % posicao)
+        arq.write(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                  % (len(objetos) + 1, catalogo, inicio_xref))
+
+
+def escreve_modelo(postos, destino):
+    '''
+    Funcao que grava um modelo Word com o cabeçalho (nome_agente, matr_agente, equipe, date_doc) e uma tabela por
+    posto com a linha de campos pNN_idx, pNN_nome, ..., pNN_bnmp
+    :param postos: lista de postos (ex.: p01, p05)
+    :param destino: caminho do .docx gerado
+    '''
+    w = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+
+    def campo(nome):
+        return ('<w:p><w:fldSimple w:instr=" MERGEFIELD {0} \\* MERGEFORMAT "><w:r><w:t>«{0}»</w:t></w:r>'
+                '</w:fldSimple></w:p>'.format(nome))
+
+    def celula(conteudo):
+        return '<w:tc>{}</w:tc>'.format(conteudo)
+
+    corpo = ''.join(campo(nome) for nome in ['nome_agente', 'matr_agente', 'equipe', 'date_doc'])
+    for posto in postos:
+        cabecalho = ''.join(celula('<w:p><w:r><w:t>{}</w:t></w:r></w:p>'.format(titulo))
+                            for titulo in ['Nº', 'Nome', 'IP', 'MP', 'MLJ', 'CS', 'BNMP'])
+        linha = ''.join(celula(campo(posto + sufixo))
+                        for sufixo in ['_idx', '_nome', '_ip', '_mp', '_mlj', '_cs', '_bnmp'])
+        corpo += ('<w:p><w:r><w:t>Posto {}</w:t></w:r></w:p><w:tbl><w:tr>{}</w:tr><w:tr>{}</w:tr></w:tbl>'
+                  .format(posto, cabecalho, linha))
+
+    documento = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                 '<w:document xmlns:w="{}"><w:body>{}<w:sectPr/></w:body></w:document>'.format(w, corpo))
+    tipos = ('<?xml version="1.0" encoding="UTF-8"?>'
+             '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+             '<Default Extension="xml" ContentType="application/xml"/>'
+             '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+             '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.'
+             'wordprocessingml.document.main+xml"/></Types>')
+    relacoes = ('<?xml version="1.0" encoding="UTF-8"?>'
+                '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/'
+                'relationships/officeDocument" Target="word/document.xml"/></Relationships>')
+    with ZipFile(destino, 'w') as docx:
+        docx.writestr('[Content_Types].xml', tipos)
+        docx.writestr('_rels/.rels', relacoes)
+        docx.writestr('word/document.xml', documento.encode('utf-8'))
+
+
+def respostas_bnmp(lista, taxa_com_mandado=0.1, seed=1) -> dict:
+    '''
+    Funcao que sorteia as respostas do stub do BNMP (bnmp_stub.py): uma fração dos presos tem uma peça em aberto
+    :return: dict {'NOME|MAE': resposta JSON}
+    '''
+    rnd = random.Random(seed)
+    respostas = {}
+    for _, presos in lista:
+        for linha in presos:
+            nome = linha[0].split('(')[0].strip()
+            if rnd.random() < taxa_com_mandado:
+                respostas['{}|{}'.format(nome, linha[1])] = {'content': [{
+                    'numeroPeca': '{:07d}.{:02d}.2021.8.07.0001'.format(rnd.randint(0, 9999999), rnd.randint(0, 99)),
+                    'nomePessoa': nome,
+                    'nomeOrgao': 'VARA CRIMINAL DE BRASILIA'}]}
+    return respostas
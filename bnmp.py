@@ -0,0 +1,246 @@
+'''
+Funções para uso do Scrapy no portal do BNMP (Selenium).
+
+As esperas são feitas por sinais da própria página (formulário liberado após o captcha, tabela de
+resultado ou aviso de sem resultado renderizados) e não por tempos fixos de espera.
+'''
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, StaleElementReferenceException
+from fake_useragent import UserAgent
+import time
+
+from normaliza import pecas_do_preso
+
+URL_BNMP = 'https://portalbnmp.cnj.jus.br/#/pesquisa-peca'
+
+XPATH_PESQUISAR = '//button[contains(@label,"Pesquisar")]'
+XPATH_VOLTAR = '//button[contains(@label,"Voltar")]'
+XPATH_SEM_RESULTADO = '//app-sem-resultado[contains(@class, "ng-star-inserted")]'
+XPATH_LINHAS = '//div[@class="ui-datatable-tablewrapper ng-star-inserted"]/table/tbody/child::tr'
+XPATH_CELULA_NOME = XPATH_LINHAS + '/td[2]/span[contains(@class, "ui-cell-data")]'
+XPATH_ERRO = '//div[contains(@class, "ui-toast-message-error")]'
+
+# Lê, em uma única chamada ao navegador, o texto das celulas de todas as linhas da tabela de resultado
+JS_LINHAS_RESULTADO = '''
+var linhas = document.evaluate(arguments[0], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+var resultado = [];
+for (var i = 0; i < linhas.snapshotLength; i++) {
+    var celulas = linhas.snapshotItem(i).querySelectorAll(':scope > td');
+    var textos = [];
+    for (var j = 0; j < celulas.length; j++) {
+        var span = celulas[j].querySelector('span.ui-cell-data');
+        textos.push(span ? span.innerText.trim() : '');
+    }
+    resultado.push(textos);
+}
+return resultado;
+'''
+
+# Intervalo, em segundos, entre as verificações das condições de espera
+INTERVALO_VERIFICACAO = 0.1
+
+
+class ErroPortalBNMP(Exception):
+    '''
+    O portal exibiu uma mensagem de erro no lugar do resultado da pesquisa (ex.: excesso de requisições)
+    '''
+
+
+class CaptchaNaoValidado(Exception):
+    '''
+    O operador não validou o captcha do portal no tempo de espera; a sessão não é aberta
+    '''
+
+
+def erro_transitorio(e) -> bool:
+    '''
+    Indica as falhas de uma consulta pelo navegador que merecem nova tentativa (ver agendador.py)
+    :param e: exceção levantada por scrapy_bnmp
+    :return: boolean
+    '''
+    return isinstance(e, (TimeoutException, StaleElementReferenceException, ErroPortalBNMP))
+
+
+def wait_element(drv, expr, timeout=15, by_tag=By.ID, to_sleep=0, metricas=None):
+    '''
+    Função para controlar o tempo de espera de carregamento da página pelo bot
+    :param drv: selenium web driver
+    :param expr: expressão xpath utilizada para encontrar o elemento desejado
+    :param timeout: tempo maximo em segundos que o Selenium ira aguardar para um elemento ser encontrado dado um criterio de busca expr
+    :param by_tag: tipo da expressão (ID | XPATH)
+    :param to_sleep: Tempo adicional de espera, em segundos
+    :param metricas: Metricas opcional onde a duração da espera é registrada ('wait_element')
+    :return: boolean
+    '''
+    inicio = time.perf_counter()
+    try:
+        element_present = EC.presence_of_element_located((by_tag, expr))
+        WebDriverWait(drv, timeout, poll_frequency=INTERVALO_VERIFICACAO).until(element_present)
+    except TimeoutException:
+        print("Timed out waiting for page to load")
+        if metricas is not None:
+            metricas.latencia('wait_element', time.perf_counter() - inicio, timeout=True)
+        return False
+    if metricas is not None:
+        metricas.latencia('wait_element', time.perf_counter() - inicio)
+    if to_sleep > 0:
+        time.sleep(to_sleep)
+    return True
+
+
+def formulario_liberado(drv):
+    '''
+    Condição de espera: o operador já validou o captcha e o formulário de pesquisa pode ser usado. O botão pode
+    ser exibido antes de o script do captcha carregar: só a resposta do captcha preenchida libera o formulário
+    :param drv: selenium web driver
+    :return: boolean
+    '''
+    botoes = drv.find_elements_by_xpath(XPATH_PESQUISAR)
+    if len(botoes) == 0 or not botoes[0].is_enabled():
+        return False
+    return drv.execute_script("try { return typeof grecaptcha !== 'undefined' && "
+                              "grecaptcha.getResponse().length > 0; } catch (e) { return false; }")
+
+
+def resultado_renderizado(drv):
+    '''
+    Condição de espera: a pesquisa terminou e a página exibe a tabela de resultados, o aviso de sem resultado ou
+    uma mensagem de erro
+    :param drv: selenium web driver
+    :return: 'sem_resultado', 'tabela', 'erro' ou False enquanto a página não estiver pronta
+    '''
+    if len(drv.find_elements_by_xpath(XPATH_ERRO)) > 0:
+        return 'erro'
+    if len(drv.find_elements_by_xpath(XPATH_SEM_RESULTADO)) > 0:
+        return 'sem_resultado'
+    if len(drv.find_elements_by_xpath(XPATH_CELULA_NOME)) > 0:
+        return 'tabela'
+    return False
+
+
+def extrai_linhas_resultado(drv):
+    '''
+    Função que extrai as linhas da tabela de resultado do BNMP em uma única ida ao navegador
+    :param drv: selenium web driver
+    :return: lista de tuplas (numero, nome, orgao), uma por linha da tabela
+    '''
+    linhas = drv.execute_script(JS_LINHAS_RESULTADO, XPATH_LINHAS) or []
+    return [(celulas[0], celulas[1], celulas[4]) for celulas in linhas if len(celulas) >= 5]
+
+
+def aguarda_captcha(drv, timeout=600):
+    '''
+    Aguarda o operador validar o captcha do portal, liberando assim que o formulário estiver utilizável
+    :param drv: selenium web driver
+    :param timeout: tempo maximo em segundos de espera pelo operador
+    :return: boolean
+    '''
+    print('Aguardando a validacao do captcha no portal do BNMP...', end='\n')
+    try:
+        WebDriverWait(drv, timeout, poll_frequency=0.5).until(formulario_liberado)
+    except TimeoutException:
+        print('Captcha nao validado em {} segundos'.format(timeout), end='\n')
+        return False
+    return True
+
+
+def abre_sessao_bnmp(executable_path="C:\\webdrivers\\chromedriver_92.exe", timeout_captcha=600):
+    '''
+    Função que abre uma sessao do navegador no portal do BNMP e aguarda a validação do captcha
+    :param executable_path: caminho do chromedriver
+    :param timeout_captcha: tempo maximo em segundos de espera pela validação do captcha
+    :return: selenium web driver
+    :raises CaptchaNaoValidado: o captcha não foi validado no tempo de espera (o navegador é fechado)
+    '''
+    options = Options()
+    ua = UserAgent()
+    userAgent = ua.random
+    options.add_argument(f'user-agent={userAgent}')
+    options.add_argument("start-maximized")
+    options.add_argument("--disable-blink-features")
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    drv = webdriver.Chrome(options=options, executable_path=executable_path)
+    drv.get(URL_BNMP)
+    if not aguarda_captcha(drv, timeout=timeout_captcha):
+        drv.quit()
+        raise CaptchaNaoValidado('captcha do BNMP nao validado em {} segundos'.format(timeout_captcha))
+    return drv
+
+
+def scrapy_bnmp(drv, nome_preso: str, nome_mae: str, timeout=15, metricas=None) -> str:
+    '''
+    Função para realizar a consulta ao BNMP
+    :param drv: selenium web driver
+    :param nome_preso: Nome do Preso
+    :param nome_mae: Nome da Mãe do Preso
+    :param timeout: tempo maximo em segundos de espera pelo resultado da pesquisa
+    :param metricas: Metricas opcional onde são registradas a duração da consulta ('scrapy_bnmp'), a espera pelo
+        resultado ('resultado_bnmp') e as esperas de wait_element
+    :return: str
+    :raises TimeoutException: o resultado não foi exibido dentro do timeout (a página não é lida, para não
+        devolver o resultado da pesquisa anterior)
+    :raises ErroPortalBNMP: o portal exibiu uma mensagem de erro
+    '''
+    if metricas is None:
+        return _scrapy_bnmp(drv, nome_preso, nome_mae, timeout)
+
+    inicio = time.perf_counter()
+    try:
+        return _scrapy_bnmp(drv, nome_preso, nome_mae, timeout, metricas)
+    finally:
+        metricas.latencia('scrapy_bnmp', time.perf_counter() - inicio)
+
+
+def _scrapy_bnmp(drv, nome_preso, nome_mae, timeout, metricas=None):
+    wait_element(drv, XPATH_PESQUISAR, timeout=timeout, by_tag=By.XPATH, metricas=metricas)
+    btn_pesquisar = drv.find_element_by_xpath(XPATH_PESQUISAR)
+    input_nomepessoa = drv.find_element_by_xpath('//input[@name="nomePessoa"]')
+    input_nomemae = drv.find_element_by_xpath('//input[@name="nomeMae"]')
+    nome_preso = nome_preso.split('(')[0].strip()
+    # Os campos podem ter ficado preenchidos por uma tentativa anterior interrompida
+    input_nomepessoa.clear()
+    input_nomemae.clear()
+    input_nomepessoa.send_keys(nome_preso)
+    input_nomemae.send_keys(nome_mae)
+
+    # A tabela da pesquisa anterior continua na página; aguarda ela ser descartada para não ler resultado velho
+    linhas_anteriores = drv.find_elements_by_xpath(XPATH_LINHAS)
+    btn_pesquisar.click()
+    inicio = time.perf_counter()
+    try:
+        if len(linhas_anteriores) > 0:
+            WebDriverWait(drv, timeout, poll_frequency=INTERVALO_VERIFICACAO).until(
+                EC.staleness_of(linhas_anteriores[0]))
+        estado = WebDriverWait(drv, timeout, poll_frequency=INTERVALO_VERIFICACAO).until(resultado_renderizado)
+    except TimeoutException:
+        # A página não é lida depois do timeout: a tabela da pesquisa anterior pode continuar nela
+        print("Timed out waiting for page to load")
+        if metricas is not None:
+            metricas.latencia('resultado_bnmp', time.perf_counter() - inicio, timeout=True)
+        raise TimeoutException('Resultado da pesquisa de {} nao exibido em {} s'.format(nome_preso, timeout))
+    if metricas is not None:
+        metricas.latencia('resultado_bnmp', time.perf_counter() - inicio)
+    if estado == 'erro':
+        raise ErroPortalBNMP('Mensagem de erro do portal na pesquisa de {}'.format(nome_preso))
+
+    if estado == 'sem_resultado':
+        try:
+            btn_voltar = drv.find_element_by_xpath(XPATH_VOLTAR)
+            btn_voltar.click()
+            wait_element(drv, XPATH_PESQUISAR, timeout=timeout, by_tag=By.XPATH, metricas=metricas)
+            return 'NC'
+        except NoSuchElementException:
+            pass
+
+    str_content = ''
+    for numero, orgao in pecas_do_preso(extrai_linhas_resultado(drv), nome_preso):
+        if len(str_content) > 1: str_content += '\n'
+        str_content += numero + '\n' + orgao
+
+    input_nomepessoa.clear()
+    input_nomemae.clear()
+    return str_content if len(str_content) > 0 else 'NC'
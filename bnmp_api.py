@@ -0,0 +1,167 @@
+'''
+Consulta ao BNMP por requisições HTTP diretas à API de pesquisa do portal.
+
+Depois que o operador valida o captcha no navegador, os cookies da sessão são copiados para um cliente
+aiohttp, que faz as pesquisas em conexões keep-alive reaproveitadas, com um limite de consultas simultâneas.
+O ClienteBNMP tem a mesma interface do PoolBNMP (submete / disponivel / encerra), podendo substituí-lo
+no mesmo ponto do script.
+'''
+import asyncio
+import threading
+import time
+
+import aiohttp
+
+from normaliza import pecas_do_preso
+
+URL_API = 'https://portalbnmp.cnj.jus.br/bnmpportal/api/pesquisa-pecas/filter'
+
+
+def erro_transitorio(e) -> bool:
+    '''
+    Indica as falhas de uma requisição que merecem nova tentativa (ver agendador.py): timeouts, falhas de
+    conexão, excesso de requisições (429) e erros do servidor (5xx)
+    :param e: exceção levantada pela requisição
+    :return: boolean
+    '''
+    if isinstance(e, aiohttp.ClientResponseError):
+        return e.status == 429 or e.status >= 500
+    return isinstance(e, (asyncio.TimeoutError, aiohttp.ClientError))
+
+
+def interpreta_resposta(dados: dict, nome_preso: str) -> str:
+    '''
+    Função que converte a resposta JSON da API no mesmo texto retornado por scrapy_bnmp
+    :param dados: JSON da resposta da API de pesquisa
+    :param nome_preso: Nome do Preso já sem o sufixo entre parenteses
+    :return: str ('numero\\norgao' de cada peça encontrada ou 'NC')
+    '''
+    linhas = [(str(peca.get('numeroPeca', '')), str(peca.get('nomePessoa', '')), str(peca.get('nomeOrgao', '')))
+              for peca in dados.get('content') or []]
+    str_content = ''
+    for numero, orgao in pecas_do_preso(linhas, nome_preso):
+        if len(str_content) > 1: str_content += '\n'
+        str_content += numero + '\n' + orgao
+    return str_content if len(str_content) > 0 else 'NC'
+
+
+class ClienteBNMP:
+    '''
+    Cliente HTTP assíncrono para a API de pesquisa do BNMP
+    :param cookies: dict com os cookies da sessão validada no navegador
+    :param user_agent: user-agent usado pelo navegador na validação do captcha
+    :param url: endereço da API de pesquisa (pode apontar para o bnmp_stub.py)
+    :param concorrencia: quantidade máxima de consultas simultâneas
+    :param timeout: tempo maximo em segundos de cada consulta
+    :param tamanho_pagina: quantidade de peças pedidas por consulta
+    :param cache: CacheBNMP opcional, consultado antes de cada requisição
+    :param metricas: Metricas opcional onde a duração de cada requisição é registrada ('api_bnmp')
+    :param agendador: AgendadorBNMP opcional; controla o ritmo, a concorrência (até concorrencia), o timeout e as
+        novas tentativas de cada requisição no lugar do limite fixo de concorrencia e do timeout fixo
+    '''
+
+    def __init__(self, cookies=None, user_agent=None, url=URL_API, concorrencia=4, timeout=15, tamanho_pagina=100,
+                 cache=None, metricas=None, agendador=None):
+        self.cookies = cookies or {}
+        self.headers = {'Content-Type': 'application/json;charset=UTF-8', 'Accept': 'application/json'}
+        if user_agent:
+            self.headers['User-Agent'] = user_agent
+        self.url = url
+        self.concorrencia = concorrencia
+        self.timeout = timeout
+        self.tamanho_pagina = tamanho_pagina
+        self.cache = cache
+        self.metricas = metricas
+        self.agendador = agendador
+        self.sessao = None
+        self.semaforo = None
+
+        # Laço de eventos próprio, em uma thread, para que o script continue recebendo Futures síncronos
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='bnmp-api', daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def da_sessao(cls, drv, **kwargs):
+        '''
+        Cria o cliente a partir de uma sessão do navegador em que o captcha já foi validado
+        :param drv: selenium web driver
+        :return: ClienteBNMP
+        '''
+        cookies = {cookie['name']: cookie['value'] for cookie in drv.get_cookies()}
+        user_agent = drv.execute_script('return navigator.userAgent;')
+        return cls(cookies=cookies, user_agent=user_agent, **kwargs)
+
+    async def _abre(self):
+        if self.sessao is None:
+            conector = aiohttp.TCPConnector(limit=self.concorrencia, keepalive_timeout=60)
+            self.sessao = aiohttp.ClientSession(connector=conector, cookies=self.cookies, headers=self.headers,
+                                                timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self.semaforo = asyncio.Semaphore(self.concorrencia)
+
+    async def consulta_async(self, nome_preso: str, nome_mae: str) -> str:
+        '''
+        Realiza a consulta de um preso na API do BNMP
+        :param nome_preso: Nome do Preso
+        :param nome_mae: Nome da Mãe do Preso
+        :return: str
+        '''
+        if self.cache is not None:
+            resultado = self.cache.busca(nome_preso, nome_mae)
+            if resultado is not None:
+                return resultado
+
+        await self._abre()
+        nome = nome_preso.split('(')[0].strip()
+        if self.agendador is not None:
+            dados = await self.agendador.executa_async(self._requisita, nome, nome_mae)
+        else:
+            async with self.semaforo:
+                dados = await self._requisita(nome, nome_mae)
+
+        resultado = interpreta_resposta(dados, nome)
+        if self.cache is not None:
+            self.cache.grava(nome_preso, nome_mae, resultado)
+        return resultado
+
+    async def _requisita(self, nome, nome_mae, timeout=None) -> dict:
+        corpo = {'buscaOrgaoRecursivo': False, 'orgaoExpeditor': {}, 'nomePessoa': nome, 'nomeMae': nome_mae}
+        parametros = {'page': 0, 'size': self.tamanho_pagina, 'sort': ''}
+        opcoes = {'timeout': aiohttp.ClientTimeout(total=timeout)} if timeout is not None else {}
+        inicio = time.perf_counter()
+        try:
+            async with self.sessao.post(self.url, params=parametros, json=corpo, **opcoes) as resposta:
+                resposta.raise_for_status()
+                dados = await resposta.json(content_type=None)
+        except asyncio.TimeoutError:
+            if self.metricas is not None:
+                self.metricas.latencia('api_bnmp', time.perf_counter() - inicio, timeout=True)
+            raise
+        if self.metricas is not None:
+            self.metricas.latencia('api_bnmp', time.perf_counter() - inicio)
+        return dados
+
+    def submete(self, nome_preso: str, nome_mae: str):
+        '''
+        Agenda uma consulta no laço de eventos do cliente
+        :param nome_preso: Nome do Preso
+        :param nome_mae: Nome da Mãe do Preso
+        :return: concurrent.futures.Future com o resultado da consulta
+        '''
+        return asyncio.run_coroutine_threadsafe(self.consulta_async(nome_preso, nome_mae), self.loop)
+
+    def disponivel(self) -> bool:
+        '''
+        :return: True se o laço de eventos do cliente ainda está em execução
+        '''
+        return self.thread.is_alive() and self.loop.is_running()
+
+    def encerra(self):
+        '''
+        Fecha as conexões e o laço de eventos do cliente
+        '''
+        if self.sessao is not None:
+            asyncio.run_coroutine_threadsafe(self.sessao.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
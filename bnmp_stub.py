@@ -0,0 +1,81 @@
+'''
+Servidor local que imita a API de pesquisa do BNMP, devolvendo respostas gravadas.
+
+Usado para testar o ClienteBNMP (bnmp_api.py) sem acessar o portal. O arquivo de respostas é um JSON no formato
+{"NOME DO PRESO|NOME DA MAE": {"content": [...]}, ...}; pesquisas sem resposta gravada devolvem {"content": []}.
+
+Exemplo: python bnmp_stub.py --respostas respostas.json --porta 8099 --latencia 0.5
+'''
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import threading
+import time
+
+
+def cria_servidor(respostas=None, porta=8099, latencia=0.0):
+    '''
+    Função que cria o servidor stub da API do BNMP
+    :param respostas: dict {'NOME|MAE': resposta JSON} com as respostas gravadas
+    :param porta: porta local do servidor (0 escolhe uma porta livre)
+    :param latencia: tempo em segundos de espera antes de cada resposta, para simular o portal
+    :return: ThreadingHTTPServer
+    '''
+    respostas = {chave.upper(): valor for chave, valor in (respostas or {}).items()}
+
+    class StubBNMP(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # mantém a conexão aberta entre as requisições (keep-alive)
+        # Cabeçalho e corpo saem em escritas separadas: sem isso o Nagle + ACK atrasado somam ~40 ms por resposta
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            corpo = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            chave = '{}|{}'.format(corpo.get('nomePessoa', ''), corpo.get('nomeMae', '')).upper()
+            servidor.consultas += 1
+            if latencia > 0:
+                time.sleep(latencia)
+            dados = json.dumps(respostas.get(chave, {'content': []})).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def log_message(self, format, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', porta), StubBNMP)
+    servidor.daemon_threads = True
+    servidor.consultas = 0
+    servidor.url = 'http://127.0.0.1:{}/bnmpportal/api/pesquisa-pecas/filter'.format(servidor.server_address[1])
+    return servidor
+
+
+def inicia_em_thread(respostas=None, porta=0, latencia=0.0):
+    '''
+    Inicia o servidor stub em uma thread, retornando-o já pronto para receber consultas
+    :return: ThreadingHTTPServer (encerrar com shutdown())
+    '''
+    servidor = cria_servidor(respostas, porta, latencia)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Servidor local que imita a API de pesquisa do BNMP')
+    parser.add_argument("--respostas", help="arquivo JSON com as respostas gravadas")
+    parser.add_argument("--porta", type=int, default=8099, help="porta local do servidor")
+    parser.add_argument("--latencia", type=float, default=0.0, help="espera em segundos antes de cada resposta")
+    args = parser.parse_args()
+
+    respostas = {}
+    if args.respostas:
+        with open(args.respostas, encoding='utf-8') as arq:
+            respostas = json.load(arq)
+
+    servidor = cria_servidor(respostas, args.porta, args.latencia)
+    print('Stub do BNMP em ' + servidor.url, end='\n')
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        servidor.shutdown()
@@ -0,0 +1,151 @@
+'''
+Cache persistente (SQLite) das consultas ao BNMP.
+
+A chave do cache é o par (nome_preso, nome_mae) normalizado. Cada registro guarda o resultado
+retornado por scrapy_bnmp ('NC' ou 'numero\\norgao'), a data em que foi gravado (para o TTL) e a
+data do ultimo acesso (para o descarte LRU quando o limite de registros é atingido).
+
+A regra de normalização das chaves tem uma versão, gravada no arquivo (PRAGMA user_version); um arquivo gravado
+com uma regra anterior tem as chaves migradas ao ser aberto, para que os resultados continuem sendo encontrados.
+'''
+import sqlite3
+import threading
+import time
+
+from normaliza import normaliza_nome
+
+# Versão da regra das chaves: 0 (arquivos sem versão) - maiúsculas, sem espaços repetidos e sem o apelido no
+# nome do preso; 1 - normaliza_nome (também sem acentos e sem o trecho entre parenteses no nome da mãe)
+VERSAO_CHAVE = 1
+
+
+def normaliza_chave(nome_preso: str, nome_mae: str) -> tuple:
+    '''
+    Funcao que normaliza o par (nome_preso, nome_mae) para uso como chave do cache
+    :param nome_preso: Nome do Preso, como consta no PDF do SISPEN
+    :param nome_mae: Nome da Mãe do Preso
+    :return: tuple (nome_preso, nome_mae) normalizados
+    '''
+    return normaliza_nome(nome_preso), normaliza_nome(nome_mae)
+
+
+class CacheBNMP:
+    '''
+    Cache das consultas ao BNMP gravado em um arquivo SQLite
+    :param caminho: caminho do arquivo SQLite
+    :param ttl_horas: validade, em horas, de um resultado gravado
+    :param max_registros: quantidade maxima de registros mantidos (descarte do menos acessado recentemente)
+    :param atualiza: se True, ignora os resultados gravados e refaz todas as consultas (forçar atualização)
+    '''
+
+    def __init__(self, caminho, ttl_horas=24, max_registros=5000, atualiza=False):
+        self.caminho = caminho
+        self.ttl = ttl_horas * 3600
+        self.max_registros = max_registros
+        self.atualiza = atualiza
+        self.acertos = 0
+        self.falhas = 0
+        self.lock = threading.Lock()  # o cache é compartilhado pelas sessões do PoolBNMP
+        self.conn = sqlite3.connect(caminho, check_same_thread=False)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS consultas (
+                nome_preso TEXT NOT NULL,
+                nome_mae   TEXT NOT NULL,
+                resultado  TEXT NOT NULL,
+                gravado_em REAL NOT NULL,
+                acessado_em REAL NOT NULL,
+                PRIMARY KEY (nome_preso, nome_mae)
+            )''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_acessado_em ON consultas (acessado_em)')
+        self.conn.commit()
+        self._migra_chaves()
+
+    def _migra_chaves(self):
+        '''
+        Regrava as chaves dos registros gravados com uma regra de normalização anterior; os de uma versão
+        desconhecida (mais nova) são descartados
+        '''
+        versao = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if versao == VERSAO_CHAVE:
+            return
+        # Em ordem de gravação: se duas chaves antigas viram a mesma, fica o resultado mais recente
+        linhas = self.conn.execute('SELECT * FROM consultas ORDER BY gravado_em').fetchall()
+        self.conn.execute('DELETE FROM consultas')
+        if versao < VERSAO_CHAVE:
+            # A regra nova aplicada sobre a chave antiga dá a mesma chave que sobre o nome original
+            self.conn.executemany('INSERT OR REPLACE INTO consultas VALUES (?, ?, ?, ?, ?)',
+                                  [normaliza_chave(nome_preso, nome_mae) + tuple(resto)
+                                   for nome_preso, nome_mae, *resto in linhas])
+        if len(linhas) > 0:
+            print('Cache BNMP: {} registros {} (versao {} das chaves para a versao {})'.format(
+                len(linhas), 'migrados' if versao < VERSAO_CHAVE else 'descartados', versao, VERSAO_CHAVE))
+        self.conn.execute('PRAGMA user_version = {}'.format(VERSAO_CHAVE))
+        self.conn.commit()
+
+    def busca(self, nome_preso: str, nome_mae: str):
+        '''
+        Busca no cache o resultado de uma consulta ainda dentro da validade
+        :param nome_preso: Nome do Preso
+        :param nome_mae: Nome da Mãe do Preso
+        :return: str com o resultado ou None caso não exista (ou esteja vencido)
+        '''
+        if self.atualiza:
+            with self.lock:
+                self.falhas += 1
+            return None
+
+        chave = normaliza_chave(nome_preso, nome_mae)
+        agora = time.time()
+        with self.lock:
+            linha = self.conn.execute('SELECT resultado FROM consultas '
+                                      'WHERE nome_preso = ? AND nome_mae = ? AND gravado_em >= ?',
+                                      chave + (agora - self.ttl,)).fetchone()
+            if linha is None:
+                self.falhas += 1
+                return None
+
+            self.conn.execute('UPDATE consultas SET acessado_em = ? WHERE nome_preso = ? AND nome_mae = ?',
+                              (agora,) + chave)
+            self.conn.commit()
+            self.acertos += 1
+        return linha[0]
+
+    def grava(self, nome_preso: str, nome_mae: str, resultado: str):
+        '''
+        Grava (ou substitui) o resultado de uma consulta e descarta os registros excedentes
+        :param nome_preso: Nome do Preso
+        :param nome_mae: Nome da Mãe do Preso
+        :param resultado: retorno da consulta ao BNMP
+        '''
+        agora = time.time()
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO consultas VALUES (?, ?, ?, ?, ?)',
+                              normaliza_chave(nome_preso, nome_mae) + (resultado, agora, agora))
+            self.conn.execute('DELETE FROM consultas WHERE rowid IN ('
+                              'SELECT rowid FROM consultas ORDER BY acessado_em DESC LIMIT -1 OFFSET ?)',
+                              (self.max_registros,))
+            self.conn.commit()
+
+    def consulta(self, consulta_bnmp, drv, nome_preso: str, nome_mae: str) -> str:
+        '''
+        Retorna o resultado do cache ou, se não houver, realiza a consulta e grava o resultado
+        :param consulta_bnmp: função de consulta ao BNMP (ex.: scrapy_bnmp)
+        :param drv: selenium web driver
+        :param nome_preso: Nome do Preso
+        :param nome_mae: Nome da Mãe do Preso
+        :return: str
+        '''
+        resultado = self.busca(nome_preso, nome_mae)
+        if resultado is None:
+            resultado = consulta_bnmp(drv, nome_preso, nome_mae)
+            self.grava(nome_preso, nome_mae, resultado)
+        return resultado
+
+    def resumo(self) -> str:
+        total = self.acertos + self.falhas
+        taxa = 100 * self.acertos / total if total else 0
+        return 'Cache BNMP: {} acertos, {} consultas realizadas ({:.0f}% de aproveitamento)'.format(
+            self.acertos, self.falhas, taxa)
+
+    def fecha(self):
+        self.conn.close()
@@ -0,0 +1,114 @@
+'''
+Cache persistente (SQLite) das páginas do PDF do SISPEN já extraídas pelo tabula.
+
+O SISPEN gera o PDF várias vezes ao dia com quase todas as páginas iguais. Cada página é identificada pelo hash
+do seu conteúdo (fluxo de desenho da página e tamanho) e das posições das colunas usadas na extração; a tabela
+extraída pelo tabula para a página fica gravada, e numa nova execução apenas as páginas alteradas passam pelo
+tabula. O tratamento (trata_df_pdf) continua sendo feito sobre todas as páginas, em ordem, o que mantém correta
+a delegacia que continua de uma página para a seguinte.
+'''
+import hashlib
+import pickle
+import sqlite3
+import threading
+import time
+
+from PyPDF2 import PdfFileReader
+from PyPDF2.generic import ArrayObject
+
+
+def conteudo_pagina(pagina) -> bytes:
+    '''
+    Funcao que retorna os bytes do fluxo de desenho de uma página do PyPDF2
+    :param pagina: PageObject
+    :return: bytes
+    '''
+    conteudo = pagina.getContents()
+    if conteudo is None:
+        return b''
+    if isinstance(conteudo, ArrayObject):
+        return b''.join(parte.getObject().getData() for parte in conteudo)
+    return conteudo.getData()
+
+
+def hash_paginas(pdf_path, columns) -> list:
+    '''
+    Funcao que calcula o hash de cada página do PDF
+    :param pdf_path: caminho do arquivo PDF
+    :param columns: posições das colunas usadas na extração (fazem parte do hash)
+    :return: lista de str, uma por página, na ordem das páginas
+    '''
+    hashes = []
+    with open(pdf_path, 'rb') as arq:
+        leitor = PdfFileReader(arq)
+        for i in range(leitor.getNumPages()):
+            pagina = leitor.getPage(i)
+            h = hashlib.sha256(repr([float(c) for c in columns]).encode('ascii'))
+            h.update(repr([float(v) for v in pagina.mediaBox]).encode('ascii'))
+            h.update(conteudo_pagina(pagina))
+            hashes.append(h.hexdigest())
+    return hashes
+
+
+class CachePaginas:
+    '''
+    Cache das páginas extraídas pelo tabula, gravado em um arquivo SQLite
+    :param caminho: caminho do arquivo SQLite
+    :param max_registros: quantidade maxima de páginas mantidas (descarte da menos usada recentemente)
+    '''
+
+    def __init__(self, caminho, max_registros=2000):
+        self.caminho = caminho
+        self.max_registros = max_registros
+        self.reaproveitadas = 0
+        self.extraidas = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(caminho, check_same_thread=False)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS paginas (
+                hash       TEXT PRIMARY KEY,
+                tabela     BLOB NOT NULL,
+                usado_em   REAL NOT NULL
+            )''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_usado_em ON paginas (usado_em)')
+        self.conn.commit()
+
+    def busca(self, hashes) -> dict:
+        '''
+        Busca as páginas já extraídas
+        :param hashes: lista dos hashes das páginas
+        :return: dict {hash: DataFrame da página} das páginas encontradas
+        '''
+        encontradas = {}
+        with self.lock:
+            for h in set(hashes):
+                linha = self.conn.execute('SELECT tabela FROM paginas WHERE hash = ?', (h,)).fetchone()
+                if linha is not None:
+                    encontradas[h] = pickle.loads(linha[0])
+            self.conn.executemany('UPDATE paginas SET usado_em = ? WHERE hash = ?',
+                                  [(time.time(), h) for h in encontradas])
+            self.conn.commit()
+        return encontradas
+
+    def grava(self, paginas):
+        '''
+        Grava as páginas extraídas e descarta as excedentes
+        :param paginas: dict {hash: DataFrame da página}
+        '''
+        agora = time.time()
+        with self.lock:
+            self.conn.executemany('INSERT OR REPLACE INTO paginas VALUES (?, ?, ?)',
+                                  [(h, pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL), agora)
+                                   for h, df in paginas.items()])
+            self.conn.execute('DELETE FROM paginas WHERE rowid IN ('
+                              'SELECT rowid FROM paginas ORDER BY usado_em DESC LIMIT -1 OFFSET ?)',
+                              (self.max_registros,))
+            self.conn.commit()
+
+    def resumo(self) -> str:
+        total = self.reaproveitadas + self.extraidas
+        return 'Paginas do PDF: {} reaproveitadas de execucoes anteriores, {} extraidas pelo tabula (de {})'.format(
+            self.reaproveitadas, self.extraidas, total)
+
+    def fecha(self):
+        self.conn.close()
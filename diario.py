@@ -0,0 +1,133 @@
+'''
+Diário das consultas ao BNMP de uma execução, para retomar o trabalho depois de uma falha.
+
+Cada consulta concluída é acrescentada a um arquivo JSON Lines e gravada no disco (fsync) antes de seguir, de
+modo que uma queda do Chrome ou a expiração da sessão no meio da lista não perde os resultados já obtidos. O
+arquivo da execução é identificado pelo hash do PDF e pelas rotas: com --retoma, uma nova execução sobre o mesmo
+PDF e as mesmas rotas recarrega o diário e consulta apenas os presos que faltam. O diário é sempre aberto para
+acréscimo (uma nova execução sem --retoma não apaga o registro da execução interrompida) e só é descartado
+quando a execução termina sem presos pendentes.
+'''
+from concurrent.futures import Future
+from os import path
+import hashlib
+import json
+import os
+import threading
+
+DIR_DIARIO = 'diario_consultas'
+
+
+def chave_execucao(pdf_path, rotas) -> str:
+    '''
+    Funcao que identifica a execução pelo conteúdo do PDF e pelas rotas (sem depender da ordem das rotas)
+    :param pdf_path: caminho do arquivo PDF
+    :param rotas: lista das rotas
+    :return: str (sha256)
+    '''
+    h = hashlib.sha256()
+    with open(pdf_path, 'rb') as arq:
+        for bloco in iter(lambda: arq.read(1 << 20), b''):
+            h.update(bloco)
+    h.update(','.join(sorted(rotas)).encode('utf-8'))
+    return h.hexdigest()
+
+
+class DiarioConsultas:
+    '''
+    Diário (JSON Lines) das consultas concluídas de uma execução
+    :param caminho: caminho do arquivo do diário
+    :param retoma: se True, as consultas já registradas não são refeitas; senão são refeitas, e os novos resultados
+        são acrescentados ao diário
+    '''
+
+    def __init__(self, caminho, retoma=False):
+        self.caminho = caminho
+        self.lock = threading.Lock()
+        concluidas = self.carrega()
+        self.concluidas = concluidas if retoma else {}
+        self.retomadas = 0
+        self.arq = open(caminho, 'a', encoding='utf-8')
+
+    @classmethod
+    def da_execucao(cls, pdf_path, rotas, diretorio=DIR_DIARIO, retoma=False):
+        '''
+        Abre o diário da execução sobre o PDF e as rotas
+        :return: DiarioConsultas
+        '''
+        os.makedirs(diretorio, exist_ok=True)
+        return cls(path.join(diretorio, chave_execucao(pdf_path, rotas)[:32] + '.jsonl'), retoma=retoma)
+
+    def carrega(self) -> dict:
+        '''
+        Lê as consultas registradas no diário e descarta a última linha se ela ficou gravada pela metade na queda
+        (a consulta é refeita), para que os novos registros comecem em uma linha nova
+        :return: dict {(nome_preso, nome_mae): resultado}
+        '''
+        concluidas = {}
+        if not path.exists(self.caminho):
+            return concluidas
+        completo = 0  # bytes até o fim da última linha completa
+        with open(self.caminho, 'rb') as arq:
+            for linha in arq:
+                if not linha.endswith(b'\n'):
+                    break
+                try:
+                    registro = json.loads(linha.decode('utf-8'))
+                except ValueError:
+                    break
+                concluidas[(registro['nome_preso'], registro['nome_mae'])] = registro['resultado']
+                completo += len(linha)
+        os.truncate(self.caminho, completo)
+        return concluidas
+
+    def registra(self, nome_preso: str, nome_mae: str, resultado: str):
+        '''
+        Acrescenta uma consulta concluída ao diário e só retorna depois de gravá-la no disco
+        '''
+        linha = json.dumps({'nome_preso': nome_preso, 'nome_mae': nome_mae, 'resultado': resultado},
+                           ensure_ascii=False)
+        with self.lock:
+            if self.arq.closed:  # consulta concluída depois do fim da execução (já preenchida como PENDENTE)
+                return
+            self.arq.write(linha + '\n')
+            self.arq.flush()
+            os.fsync(self.arq.fileno())
+
+    def envolve(self, submete):
+        '''
+        Envolve a função de consulta (PoolBNMP.submete ou ClienteBNMP.submete): os presos já registrados no diário
+        não são consultados de novo e cada consulta concluída é registrada
+        :param submete: função (nome_preso, nome_mae) -> concurrent.futures.Future
+        :return: função com a mesma assinatura
+        '''
+        def submete_com_diario(nome_preso: str, nome_mae: str):
+            chave = (nome_preso, nome_mae)
+            if chave in self.concluidas:
+                self.retomadas += 1
+                futuro = Future()
+                futuro.set_result(self.concluidas[chave])
+                return futuro
+
+            def concluida(futuro):
+                if not futuro.cancelled() and futuro.exception() is None:
+                    self.registra(nome_preso, nome_mae, futuro.result())
+
+            futuro = submete(nome_preso, nome_mae)
+            futuro.add_done_callback(concluida)
+            return futuro
+        return submete_com_diario
+
+    def resumo(self) -> str:
+        return 'Diario das consultas: {} presos retomados de uma execucao anterior ({})'.format(
+            self.retomadas, self.caminho)
+
+    def fecha(self, descarta=False):
+        '''
+        Fecha o diário; as consultas que terminarem depois disso não são registradas
+        :param descarta: apaga o diário (execução terminada sem presos pendentes)
+        '''
+        with self.lock:
+            self.arq.close()
+            if descarta:
+                os.remove(self.caminho)
@@ -0,0 +1,177 @@
+'''
+Arquivo histórico das listas de presos do SISPEN, em Parquet particionado por data, com consultas rápidas.
+
+Cada execução acrescenta a tabela de presos já tratada (com a delegacia, o posto, a rota, os nomes normalizados
+e o resultado do BNMP) em um arquivo Parquet comprimido da partição do dia, com as linhas ordenadas pelo nome
+normalizado; as estatísticas de cada grupo de linhas do Parquet permitem pular os grupos que não têm o nome
+procurado. Ao lado das partições fica o índice _indice.parquet, com os pares distintos (nome_norm, delegacia,
+data), pequeno o bastante para responder sozinho "há quantos dias este preso está na lista" e "quais
+delegacias cresceram no mês"; os detalhes de um preso são lidos apenas das partições dos dias indicados pelo
+índice e apenas das colunas pedidas, com os arquivos mapeados em memória.
+
+    historico/
+        _indice.parquet
+        data=2021-03-01/execucao-083012-402113-9f1c2a7b.parquet
+        data=2021-03-02/execucao-081544-087350-51d04e6c.parquet
+        ...
+
+Exemplos:
+    python historico.py preso "FULANO DE TAL"
+    python historico.py delegacias --de 2021-03-01 --ate 2021-03-31
+'''
+from __future__ import print_function
+from datetime import date, datetime
+from os import path
+import argparse
+import os
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from normaliza import normaliza_nome
+
+DIR_HISTORICO = 'historico'
+INDICE = '_indice.parquet'  # o prefixo '_' deixa o índice fora da leitura das partições
+
+COLUNAS_HISTORICO = ['nome_preso', 'nome_mae', 'dt_nascimento', 'ocorrencia', 'dt_cadastro', 'delegacia', 'dp',
+                     'rota', 'nome_norm', 'mae_norm', 'bnmp', 'execucao']
+ESQUEMA = pa.schema([(coluna, pa.string()) for coluna in COLUNAS_HISTORICO])
+ESQUEMA_INDICE = pa.schema([('nome_norm', pa.string()), ('delegacia', pa.string()), ('data', pa.string())])
+
+
+def _como_texto(df, colunas) -> pd.DataFrame:
+    # Todas as colunas são gravadas como texto (None onde não há valor), com o mesmo esquema em todos os dias
+    df = df.reindex(columns=colunas)
+    return df.astype(object).where(df.notna(), None).applymap(lambda v: v if v is None else str(v))
+
+
+def arquiva(registros, diretorio=DIR_HISTORICO, quando=None) -> str:
+    '''
+    Funcao que acrescenta os presos de uma execução ao arquivo histórico e atualiza o índice
+    :param registros: lista de dicts, um por preso (ver PipelineEscolta.registros), ou DataFrame
+    :param diretorio: diretório do arquivo histórico
+    :param quando: datetime da execução (padrão: agora); define a partição do dia
+    :return: caminho do arquivo Parquet gravado
+    '''
+    quando = quando or datetime.now()
+    dia = '{:%Y-%m-%d}'.format(quando)
+    df = pd.DataFrame(registros).assign(execucao=quando.isoformat(timespec='seconds'))
+    df = _como_texto(df, COLUNAS_HISTORICO).sort_values('nome_norm', kind='mergesort')
+
+    particao = path.join(diretorio, 'data=' + dia)
+    os.makedirs(particao, exist_ok=True)
+    # Microssegundos e um sufixo aleatório: duas execuções no mesmo segundo (ou com o mesmo quando) não se
+    # sobrescrevem
+    caminho = path.join(particao, 'execucao-{:%H%M%S-%f}-{}.parquet'.format(quando, uuid.uuid4().hex[:8]))
+    pq.write_table(pa.Table.from_pandas(df, schema=ESQUEMA, preserve_index=False), caminho,
+                   compression='zstd', row_group_size=256)
+
+    atualiza_indice(df[['nome_norm', 'delegacia']].assign(data=dia), diretorio)
+    return caminho
+
+
+def atualiza_indice(novos, diretorio=DIR_HISTORICO):
+    '''
+    Funcao que acrescenta ao índice os pares (nome_norm, delegacia, data) de uma execução
+    :param novos: DataFrame com as colunas nome_norm, delegacia e data
+    :param diretorio: diretório do arquivo histórico
+    '''
+    caminho = path.join(diretorio, INDICE)
+    indice = _como_texto(novos, ESQUEMA_INDICE.names)
+    if path.exists(caminho):
+        indice = pd.concat([pq.read_table(caminho, memory_map=True).to_pandas(), indice], ignore_index=True)
+    indice = indice.drop_duplicates().sort_values(['nome_norm', 'data'], kind='mergesort')
+
+    # Gravado em um arquivo temporário e trocado de uma vez: uma consulta simultânea nunca lê o índice pela metade
+    temporario = caminho + '.tmp'
+    pq.write_table(pa.Table.from_pandas(indice, schema=ESQUEMA_INDICE, preserve_index=False), temporario,
+                   compression='zstd')
+    os.replace(temporario, caminho)
+
+
+def le_indice(diretorio=DIR_HISTORICO, filtros=None) -> pd.DataFrame:
+    '''
+    :param filtros: filtros do pyarrow, ex.: [('nome_norm', '=', 'FULANO DE TAL')]
+    :return: DataFrame com as colunas nome_norm, delegacia e data
+    '''
+    caminho = path.join(diretorio, INDICE)
+    if not path.exists(caminho):
+        return pd.DataFrame(columns=ESQUEMA_INDICE.names)
+    return pq.read_table(caminho, filters=filtros, memory_map=True).to_pandas()
+
+
+def consulta_preso(nome, diretorio=DIR_HISTORICO, colunas=None) -> tuple:
+    '''
+    Funcao que busca um preso no arquivo histórico pelo nome (comparado já normalizado)
+    :param nome: nome do preso
+    :param diretorio: diretório do arquivo histórico
+    :param colunas: colunas lidas das partições (padrão: delegacia, dp, rota, bnmp e execucao)
+    :return: tupla (dias, DataFrame com uma linha por aparição do preso, lida apenas das partições desses dias)
+    '''
+    nome_norm = normaliza_nome(nome)
+    colunas = colunas or ['delegacia', 'dp', 'rota', 'bnmp', 'execucao']
+    dias = sorted(le_indice(diretorio, [('nome_norm', '=', nome_norm)])['data'].unique())
+    if len(dias) == 0:
+        return dias, pd.DataFrame(columns=['data'] + colunas)
+
+    tabela = pq.read_table(diretorio, columns=['data'] + colunas, memory_map=True,
+                           filters=[('data', 'in', dias), ('nome_norm', '=', nome_norm)])
+    aparicoes = tabela.to_pandas()
+    aparicoes['data'] = aparicoes['data'].astype(str)
+    return dias, aparicoes.sort_values(['data', 'execucao'], kind='mergesort').reset_index(drop=True)
+
+
+def presos_por_delegacia(de=None, ate=None, diretorio=DIR_HISTORICO) -> pd.DataFrame:
+    '''
+    Funcao que conta, apenas pelo índice, os presos distintos de cada delegacia em cada dia do período
+    :param de: primeiro dia (AAAA-MM-DD), inclusive
+    :param ate: último dia (AAAA-MM-DD), inclusive
+    :return: DataFrame com uma linha por delegacia e uma coluna por dia
+    '''
+    filtros = [('data', '>=', de)] if de else []
+    filtros += [('data', '<=', ate)] if ate else []
+    indice = le_indice(diretorio, filtros or None)
+    return (indice.groupby(['delegacia', 'data'])['nome_norm'].nunique()
+            .unstack('data', fill_value=0).sort_index(axis=1))
+
+
+def variacao_delegacias(de=None, ate=None, diretorio=DIR_HISTORICO) -> pd.DataFrame:
+    '''
+    :return: DataFrame com os presos de cada delegacia no primeiro e no último dia do período e a variação,
+        das delegacias que mais cresceram para as que mais diminuíram
+    '''
+    contagem = presos_por_delegacia(de, ate, diretorio)
+    if contagem.shape[1] == 0:
+        return pd.DataFrame(columns=['primeiro_dia', 'ultimo_dia', 'variacao', 'media'])
+    resumo = pd.DataFrame({'primeiro_dia': contagem.iloc[:, 0], 'ultimo_dia': contagem.iloc[:, -1],
+                           'media': contagem.mean(axis=1).round(1)})
+    resumo['variacao'] = resumo['ultimo_dia'] - resumo['primeiro_dia']
+    return resumo[['primeiro_dia', 'ultimo_dia', 'variacao', 'media']].sort_values('variacao', ascending=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Consultas ao arquivo historico das listas de presos do SISPEN')
+    parser.add_argument("--dir", default=DIR_HISTORICO, help="diretorio do arquivo historico")
+    comandos = parser.add_subparsers(dest='comando')
+
+    p_preso = comandos.add_parser('preso', help="dias em que o preso esteve na lista e as delegacias")
+    p_preso.add_argument("nome", help="nome do preso (comparado sem acentos e sem o apelido entre parenteses)")
+
+    p_delegacias = comandos.add_parser('delegacias', help="presos por delegacia no periodo e a variacao")
+    p_delegacias.add_argument("--de", help="primeiro dia (AAAA-MM-DD; padrao: primeiro dia do mes)")
+    p_delegacias.add_argument("--ate", help="ultimo dia (AAAA-MM-DD)")
+
+    args = parser.parse_args()
+    if args.comando == 'preso':
+        dias, aparicoes = consulta_preso(args.nome, args.dir)
+        print('Dias na lista: {}'.format(len(dias)), end='\n')
+        if len(dias) > 0:
+            print('Primeiro dia: {}  Ultimo dia: {}'.format(dias[0], dias[-1]), end='\n')
+            print(aparicoes.to_string(index=False), end='\n')
+    elif args.comando == 'delegacias':
+        de = args.de or '{:%Y-%m-01}'.format(date.today())
+        print(variacao_delegacias(de, args.ate, args.dir).to_string(), end='\n')
+    else:
+        parser.print_help()
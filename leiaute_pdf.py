@@ -0,0 +1,310 @@
+'''
+Detecção das posições das colunas da tabela do PDF do SISPEN, no lugar das posições fixas passadas ao tabula.
+
+As divisões entre as colunas são obtidas da linha de cabeçalho da tabela ("Nome do Preso", mãe, nascimento,
+ocorrência e cadastro) e das linhas de dados abaixo dela: cada divisão fica um pouco à esquerda do início da
+coluna seguinte, que é o início do rótulo ou, com os rótulos centralizados, o início mais à esquerda dos dados
+dessa coluna nas linhas completas. As posições dos textos são lidas do fluxo de desenho das páginas pelo
+PyPDF2, sem a JVM; quando o texto não pode ser lido assim (ex.: fontes com codificação própria), a leitura é
+feita pelo tabula em JSON, que devolve a posição de cada texto, sem o guess=True.
+
+O resultado é guardado em um arquivo JSON indexado pela impressão digital do leiaute — tamanho da página, fontes
+e programa que gerou o PDF, lidos do dicionário da primeira página e das informações do documento, sem
+interpretar o conteúdo. Os PDFs seguintes com o mesmo leiaute não pagam a detecção; um leiaute novo é detectado
+uma vez, antes da extração, de modo que uma mudança do PDF aparece logo na leitura e não depois das consultas.
+Como a impressão digital não descreve a geometria da tabela, junto com as colunas é guardada a posição (x) de
+cada rótulo do cabeçalho; a cada PDF basta procurá-las nos operadores de posicionamento de texto (Tm, Td) do
+fluxo de desenho da página do cabeçalho, sem interpretá-lo (ver confere_rotulos). Se não estiverem lá (mesmo
+gerador e fontes, colunas deslocadas), as colunas são detectadas de novo.
+'''
+from __future__ import print_function
+from datetime import datetime
+from decimal import Decimal
+from os import path
+import hashlib
+import json
+import os
+import re
+
+from PyPDF2 import PdfFileReader
+from PyPDF2.generic import ByteStringObject
+from PyPDF2.pdf import ContentStream
+
+from cache_paginas import conteudo_pagina
+from normaliza import normaliza_nome
+
+LEIAUTES_PDF = 'leiautes_pdf.json'
+
+# Rótulos das colunas na linha de cabeçalho da tabela, já normalizados (maiúsculas e sem acentos), na ordem
+# das colunas de sispen.COLUNAS
+ROTULOS_CABECALHO = [re.compile(r'^NOME DO PRESO'), re.compile(r'^(NOME DA )?MAE'), re.compile(r'NASC'),
+                     re.compile(r'OCORR'), re.compile(r'CADASTR')]
+
+MARGEM = 5  # distância (em pontos) entre a divisão e o início do rótulo da coluna seguinte
+TOLERANCIA_LINHA = 2  # diferença máxima de altura (em pontos) entre textos da mesma linha
+MAX_PAGINAS_DETECCAO = 5  # páginas examinadas até encontrar o cabeçalho da tabela
+TOLERANCIA_ROTULO = 1  # diferença máxima (em pontos) entre a posição guardada de um rótulo e a encontrada
+
+# Posição (e, f) dos textos no fluxo de desenho: "a b c d e f Tm" ou "x y Td" logo depois de BT
+RE_POSICAO_TEXTO = re.compile(rb'(-?\d*\.?\d+)\s+(-?\d*\.?\d+)\s+Tm\b'
+                              rb'|BT\s+(?:/\S+\s+-?\d*\.?\d+\s+Tf\s+)?(-?\d*\.?\d+)\s+(-?\d*\.?\d+)\s+Td\b')
+
+
+def impressao_digital(pdf_path) -> str:
+    '''
+    Funcao que calcula a impressão digital do leiaute do PDF: tamanho da primeira página, nomes das fontes e
+    programa que gerou o arquivo
+    :param pdf_path: caminho do arquivo PDF
+    :return: str (sha256)
+    '''
+    with open(pdf_path, 'rb') as arq:
+        leitor = PdfFileReader(arq)
+        pagina = leitor.getPage(0)
+        info = leitor.getDocumentInfo() or {}
+        fontes = pagina.get('/Resources', {}).get('/Font', {})
+        partes = [
+            [float(v) for v in pagina.mediaBox],
+            sorted(str(fonte.getObject().get('/BaseFont', '')) for fonte in fontes.values()),
+            str(info.get('/Producer', '')),
+            str(info.get('/Creator', '')),
+        ]
+    return hashlib.sha256(repr(partes).encode('utf-8')).hexdigest()
+
+
+def _multiplica(m1, m2) -> list:
+    # Produto de duas matrizes de transformação do PDF [a b c d e f]
+    a1, b1, c1, d1, e1, f1 = m1
+    a2, b2, c2, d2, e2, f2 = m2
+    return [a1 * a2 + b1 * c2, a1 * b2 + b1 * d2, c1 * a2 + d1 * c2, c1 * b2 + d1 * d2,
+            e1 * a2 + f1 * c2 + e2, e1 * b2 + f1 * d2 + f2]
+
+
+def _texto(operando) -> str:
+    if isinstance(operando, ByteStringObject):
+        return bytes(operando).decode('latin-1')
+    return str(operando)
+
+
+def textos_pagina(pagina, leitor) -> list:
+    '''
+    Funcao que lê os textos de uma página com a posição em que cada um começa
+    :param pagina: PageObject do PyPDF2
+    :param leitor: PdfFileReader da página
+    :return: lista de tuplas (x, y, texto), em pontos a partir do canto inferior esquerdo da página
+    '''
+    identidade = [1, 0, 0, 1, 0, 0]
+    conteudo = pagina.getContents()
+    if conteudo is None:
+        return []
+
+    textos = []
+    ctm, pilha = identidade, []
+    tm = tlm = identidade
+    entrelinha = 0
+    for operandos, operador in ContentStream(conteudo, leitor).operations:
+        if operador == b'q':
+            pilha.append(ctm)
+        elif operador == b'Q':
+            ctm = pilha.pop() if pilha else identidade
+        elif operador == b'cm':
+            ctm = _multiplica([float(v) for v in operandos], ctm)
+        elif operador == b'BT':
+            tm = tlm = identidade
+        elif operador == b'Tm':
+            tm = tlm = [float(v) for v in operandos]
+        elif operador in (b'Td', b'TD'):
+            tx, ty = float(operandos[0]), float(operandos[1])
+            if operador == b'TD':
+                entrelinha = -ty
+            tm = tlm = _multiplica([1, 0, 0, 1, tx, ty], tlm)
+        elif operador == b'TL':
+            entrelinha = float(operandos[0])
+        elif operador in (b'T*', b"'", b'"'):
+            tm = tlm = _multiplica([1, 0, 0, 1, 0, -entrelinha], tlm)
+
+        if operador in (b'Tj', b"'", b'"', b'TJ'):
+            if operador == b'TJ':
+                # Os números do TJ (NumberObject, FloatObject) são ajustes de espaçamento, não texto
+                texto = ''.join(_texto(parte) for parte in operandos[0]
+                                if not isinstance(parte, (int, float, Decimal)))
+            else:
+                texto = _texto(operandos[-1])
+            x, y = _multiplica(tm, ctm)[4:6]
+            if texto.strip():
+                textos.append((x, y, texto))
+    return textos
+
+
+def _linhas(textos, tolerancia=TOLERANCIA_LINHA) -> list:
+    # Agrupa os textos em linhas (mesma altura), de cima para baixo, cada linha ordenada da esquerda para a direita
+    linhas = []
+    for x, y, texto in sorted(textos, key=lambda t: -t[1]):
+        if len(linhas) > 0 and abs(linhas[-1][0] - y) <= tolerancia:
+            linhas[-1][1].append((x, texto))
+        else:
+            linhas.append((y, [(x, texto)]))
+    return [(y, sorted(linha)) for y, linha in linhas]
+
+
+def inicios_cabecalho(textos) -> tuple:
+    '''
+    Funcao que localiza a linha de cabeçalho da tabela e o início de cada rótulo
+    :param textos: lista de tuplas (x, y, texto) de uma página
+    :return: tupla (y da linha de cabeçalho, lista do x de início de cada rótulo) ou None
+    '''
+    for y, linha in _linhas([(x, y, normaliza_nome(texto)) for x, y, texto in textos]):
+        inicios = []
+        for rotulo in ROTULOS_CABECALHO:
+            inicio = next((x for x, texto in linha if rotulo.search(texto) and (not inicios or x > inicios[-1])),
+                          None)
+            if inicio is None:
+                break
+            inicios.append(inicio)
+        else:
+            return y, inicios
+    return None
+
+
+def colunas_do_cabecalho(textos, x_pagina=0) -> list:
+    '''
+    Funcao que calcula as divisões entre as colunas a partir da linha de cabeçalho da tabela e das linhas
+    completas (um texto por coluna) abaixo dela
+    :param textos: lista de tuplas (x, y, texto) de uma página
+    :param x_pagina: x do canto esquerdo da página (as posições do tabula são medidas a partir dele)
+    :return: lista das divisões (em pontos) ou None se a página não tiver o cabeçalho completo
+    '''
+    cabecalho = _cabecalho(textos, x_pagina)
+    return None if cabecalho is None else cabecalho[0]
+
+
+def _cabecalho(textos, x_pagina=0):
+    # Tupla (divisões entre as colunas, x de início de cada rótulo) ou None
+    cabecalho = inicios_cabecalho(textos)
+    if cabecalho is None:
+        return None
+    y_cabecalho, inicios = cabecalho
+    completas = [[x for x, _ in linha] for y, linha in _linhas(textos)
+                 if y < y_cabecalho - TOLERANCIA_LINHA and len(linha) == len(inicios)]
+
+    colunas = []
+    for k in range(1, len(inicios)):
+        inicio = inicios[k]
+        # Rótulo centralizado: a coluna começa onde começam os seus dados, à esquerda do rótulo, desde que
+        # depois de todos os dados da coluna anterior
+        if len(completas) > 0 and min(xs[k] for xs in completas) > max(xs[k - 1] for xs in completas):
+            inicio = min(inicio, min(xs[k] for xs in completas))
+        colunas.append(round(inicio - x_pagina - MARGEM, 1))
+    return colunas, inicios
+
+
+def _detecta_pypdf2(pdf_path):
+    with open(pdf_path, 'rb') as arq:
+        leitor = PdfFileReader(arq)
+        for i in range(min(MAX_PAGINAS_DETECCAO, leitor.getNumPages())):
+            pagina = leitor.getPage(i)
+            cabecalho = _cabecalho(textos_pagina(pagina, leitor), float(pagina.mediaBox.getLowerLeft_x()))
+            if cabecalho is not None:
+                colunas, inicios = cabecalho
+                return colunas, {'pagina': i, 'x_rotulos': [round(x, 1) for x in inicios]}
+    return None
+
+
+def _detecta_tabula(pdf_path):
+    import tabula
+
+    with open(pdf_path, 'rb') as arq:
+        leitor = PdfFileReader(arq)
+        n_paginas = leitor.getNumPages()
+        x_paginas = [float(leitor.getPage(i).mediaBox.getLowerLeft_x())
+                     for i in range(min(MAX_PAGINAS_DETECCAO, n_paginas))]
+    for i, x_pagina in enumerate(x_paginas):
+        tabelas = tabula.read_pdf(pdf_path, output_format='json', guess=False, pages=i + 1)
+        textos = [(celula['left'], -celula['top'], celula['text'])
+                  for tabela in tabelas for linha in tabela['data'] for celula in linha if celula.get('text')]
+        cabecalho = _cabecalho(textos)
+        if cabecalho is not None:
+            colunas, inicios = cabecalho
+            # As posições do tabula são medidas a partir do canto esquerdo da página
+            return colunas, {'pagina': i, 'x_rotulos': [round(x + x_pagina, 1) for x in inicios]}
+    return None
+
+
+def posicoes_texto(pdf_path, pagina=0) -> list:
+    '''
+    Funcao que lê, sem interpretar o fluxo de desenho, as posições em que os textos da página são colocados
+    :param pdf_path: caminho do arquivo PDF
+    :param pagina: índice da página (a partir de 0)
+    :return: lista de tuplas (x, y)
+    '''
+    with open(pdf_path, 'rb') as arq:
+        leitor = PdfFileReader(arq)
+        if pagina >= leitor.getNumPages():
+            return []
+        conteudo = conteudo_pagina(leitor.getPage(pagina))
+    return [(float(m.group(1) or m.group(3)), float(m.group(2) or m.group(4)))
+            for m in RE_POSICAO_TEXTO.finditer(conteudo)]
+
+
+def confere_rotulos(pdf_path, verificador) -> bool:
+    '''
+    Funcao que confere se a página do cabeçalho tem uma linha com textos começando na posição guardada de cada
+    rótulo (as colunas guardadas continuam valendo)
+    :param pdf_path: caminho do arquivo PDF
+    :param verificador: dict {'pagina': índice da página, 'x_rotulos': [x de cada rótulo]}
+    :return: boolean
+    '''
+    linhas = {}
+    for x, y in posicoes_texto(pdf_path, verificador['pagina']):
+        linhas.setdefault(round(y), []).append(x)
+    return any(all(any(abs(x - x_texto) <= TOLERANCIA_ROTULO for x_texto in xs) for x in verificador['x_rotulos'])
+               for xs in linhas.values())
+
+
+def _detecta(pdf_path):
+    # Tupla (divisões entre as colunas, verificador guardado com elas)
+    detectado = _detecta_pypdf2(pdf_path) or _detecta_tabula(pdf_path)
+    if detectado is None:
+        raise ValueError('Cabecalho da tabela ("Nome do Preso", ...) nao encontrado nas primeiras {} paginas de {}; '
+                         'informe as colunas com --colunas-pdf'.format(MAX_PAGINAS_DETECCAO, pdf_path))
+    return detectado
+
+
+def detecta_colunas(pdf_path) -> list:
+    '''
+    Funcao que detecta as divisões entre as colunas da tabela pelo cabeçalho "Nome do Preso"
+    :param pdf_path: caminho do arquivo PDF
+    :return: lista das divisões (em pontos), no formato do parâmetro columns do tabula
+    '''
+    return _detecta(pdf_path)[0]
+
+
+def colunas_do_pdf(pdf_path, caminho=LEIAUTES_PDF) -> list:
+    '''
+    Funcao que retorna as divisões entre as colunas do PDF, detectadas na primeira vez que o leiaute aparece e
+    de novo quando os rótulos do cabeçalho não estão mais nas posições guardadas
+    :param pdf_path: caminho do arquivo PDF
+    :param caminho: arquivo JSON com os leiautes já detectados
+        {impressao_digital: {'colunas': [...], 'verificador': {...}, ...}}
+    :return: lista das divisões (em pontos)
+    '''
+    leiautes = {}
+    if path.exists(caminho):
+        with open(caminho, encoding='utf-8') as arq:
+            leiautes = json.load(arq)
+
+    chave = impressao_digital(pdf_path)
+    if chave in leiautes and 'verificador' in leiautes[chave]:
+        if confere_rotulos(pdf_path, leiautes[chave]['verificador']):
+            return leiautes[chave]['colunas']
+        print('Os rotulos do cabecalho nao estao nas posicoes guardadas para este leiaute; detectando de novo',
+              end='\n')
+
+    colunas, verificador = _detecta(pdf_path)
+    leiautes[chave] = {'colunas': colunas, 'verificador': verificador, 'pdf': path.basename(pdf_path),
+                       'detectado_em': datetime.now().isoformat(timespec='seconds')}
+    temporario = caminho + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as arq:
+        json.dump(leiautes, arq, indent=2, ensure_ascii=False)
+    os.replace(temporario, caminho)
+    print('Novo leiaute do PDF detectado; colunas: {}'.format(','.join('{:g}'.format(c) for c in colunas)), end='\n')
+    return colunas
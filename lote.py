@@ -0,0 +1,68 @@
+'''
+Arquivo de lote: vários documentos (um por equipe) gerados a partir de uma única leitura do PDF.
+
+O arquivo é um JSON com uma lista de trabalhos, cada um com as rotas e o cabeçalho de uma equipe:
+
+    [
+        {"rotas": "sul,leste", "agente": "Renata", "matricula": "590010", "equipe": "3", "saida": "equipe3.docx"},
+        {"rotas": "oeste", "agente": "Carlos", "matricula": "590020", "equipe": "4", "saida": "equipe4.docx"}
+    ]
+
+O PDF é tratado uma vez, os presos da união das rotas são consultados uma vez no BNMP e cada documento é
+preenchido com os resultados compartilhados.
+'''
+import json
+import os
+
+CAMPOS_CABECALHO = ['agente', 'matricula', 'equipe']
+
+
+def le_lote(caminho) -> list:
+    '''
+    Funcao que lê e valida o arquivo de lote
+    :param caminho: caminho do arquivo JSON
+    :return: lista de dicts {'rotas': [rota, ...], 'agente', 'matricula', 'equipe', 'saida'}
+    '''
+    with open(caminho, encoding='utf-8') as arq:
+        trabalhos = json.load(arq)
+    if not isinstance(trabalhos, list) or len(trabalhos) == 0:
+        raise ValueError('O arquivo de lote {} deve conter uma lista de trabalhos'.format(caminho))
+
+    lote = []
+    saidas = set()
+    for i, trabalho in enumerate(trabalhos, start=1):
+        faltando = [campo for campo in ['rotas', 'saida'] + CAMPOS_CABECALHO if not trabalho.get(campo)]
+        if len(faltando) > 0:
+            raise ValueError('Trabalho {} do lote {} sem os campos: {}'.format(i, caminho, ', '.join(faltando)))
+        if trabalho['saida'] in saidas:
+            raise ValueError('Arquivo de saida repetido no lote {}: {}'.format(caminho, trabalho['saida']))
+        saidas.add(trabalho['saida'])
+
+        rotas = trabalho['rotas']
+        if isinstance(rotas, str):
+            rotas = rotas.split(',')
+        lote.append(dict({campo: str(trabalho[campo]) for campo in CAMPOS_CABECALHO},
+                         rotas=[rota.strip() for rota in rotas], saida=trabalho['saida']))
+    return lote
+
+
+def uniao_rotas(lote) -> list:
+    '''
+    :return: rotas de todos os trabalhos do lote, sem repetição e na ordem em que aparecem
+    '''
+    return list(dict.fromkeys(rota for trabalho in lote for rota in trabalho['rotas']))
+
+
+def divide_por_rota(lote) -> list:
+    '''
+    Funcao que divide cada trabalho em um trabalho por rota, para que o documento de cada rota seja gravado assim
+    que as consultas da rota terminam
+    :param lote: lista de trabalhos
+    :return: lista de trabalhos com uma rota cada, gravados em <saida>-<rota>.docx
+    '''
+    por_rota = []
+    for trabalho in lote:
+        base, extensao = os.path.splitext(trabalho['saida'])
+        for rota in trabalho['rotas']:
+            por_rota.append(dict(trabalho, rotas=[rota], saida='{}-{}{}'.format(base, rota, extensao)))
+    return por_rota
@@ -0,0 +1,180 @@
+'''
+Métricas de desempenho de uma execução, gravadas em JSON para acompanhar a evolução dia a dia.
+
+Registra o tempo de cada etapa (somado quando a etapa roda em partes ou em várias threads), a latência e a
+quantidade de timeouts de cada tipo de espera (scrapy_bnmp, wait_element, consulta à API), contadores
+(ex.: acertos do cache, linhas por posto) e o pico de memória. Por padrão o pico é o da memória residente do
+processo (getrusage, ou psutil no Windows), que não custa nada à execução; o tracemalloc, que mede a memória
+alocada pelo Python mas instrumenta cada alocação e deixa o tratamento do PDF algumas vezes mais lento, só é ligado
+quando pedido. O relatório indica qual das duas medições foi usada.
+'''
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime
+from time import perf_counter
+import json
+import statistics
+import sys
+import threading
+import tracemalloc
+
+# Limites superiores (em segundos) das faixas do histograma de latência; a última faixa é acima de 30 s
+FAIXAS_LATENCIA = [0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 15, 30]
+
+
+def pico_rss():
+    '''
+    Funcao que lê o pico de memória residente do processo desde a sua partida, sem instrumentar as alocações
+    :return: int (bytes) ou None quando não há como medir (Windows sem o psutil)
+    '''
+    try:
+        import resource
+    except ImportError:  # Windows
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return getattr(psutil.Process().memory_info(), 'peak_wset', None)
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico if sys.platform == 'darwin' else pico * 1024  # o Linux informa em kB
+
+
+def percentil(valores_ordenados, p) -> float:
+    '''
+    :param valores_ordenados: lista ordenada e não vazia
+    :param p: percentil entre 0 e 100
+    :return: valor do percentil (vizinho mais próximo)
+    '''
+    i = min(len(valores_ordenados) - 1, max(0, int(round(p / 100 * len(valores_ordenados) + 0.5)) - 1))
+    return valores_ordenados[i]
+
+
+def resume_latencias(valores, timeouts=0) -> dict:
+    '''
+    Funcao que resume uma lista de latências em estatísticas e histograma
+    :param valores: latências em segundos
+    :param timeouts: quantidade de esperas encerradas por timeout
+    :return: dict
+    '''
+    ordenados = sorted(valores)
+    histograma = [0] * (len(FAIXAS_LATENCIA) + 1)
+    for valor in ordenados:
+        histograma[bisect_left(FAIXAS_LATENCIA, valor)] += 1
+    rotulos = ['<={}s'.format(limite) for limite in FAIXAS_LATENCIA] + ['>{}s'.format(FAIXAS_LATENCIA[-1])]
+
+    resumo = {'quantidade': len(ordenados), 'timeouts': timeouts,
+              'histograma': dict(zip(rotulos, histograma))}
+    if len(ordenados) > 0:
+        resumo.update(total=sum(ordenados), media=statistics.mean(ordenados), minimo=ordenados[0],
+                      p50=percentil(ordenados, 50), p90=percentil(ordenados, 90), p99=percentil(ordenados, 99),
+                      maximo=ordenados[-1])
+    return resumo
+
+
+class Metricas:
+    '''
+    Coletor das métricas de uma execução, compartilhado entre as threads (sessões do BNMP, leitura do PDF)
+    :param memoria: medição do pico de memória: 'rss' (memória residente do processo; no servidor.py inclui os
+        trabalhos anteriores), 'tracemalloc' (memória alocada pelo Python, deixa a execução mais lenta) ou None; o
+        tracemalloc iniciado aqui é parado em grava (ou encerra), para não seguir ligado nos trabalhos seguintes do
+        servidor.py
+    '''
+
+    def __init__(self, memoria='rss'):
+        self.inicio = perf_counter()
+        self.data = datetime.now().isoformat(timespec='seconds')
+        self.etapas = {}
+        self.latencias = {}
+        self.timeouts = {}
+        self.contadores = {}
+        self.lock = threading.Lock()
+        self.memoria = memoria
+        self.pico_memoria = None
+        self.rastreia = memoria == 'tracemalloc' and not tracemalloc.is_tracing()
+        if self.rastreia:
+            tracemalloc.start()
+        elif memoria == 'tracemalloc' and hasattr(tracemalloc, 'reset_peak'):  # Python 3.9+
+            # tracemalloc já ligado por outro: o pico passa a ser o desta execução
+            tracemalloc.reset_peak()
+
+    @contextmanager
+    def etapa(self, nome):
+        '''
+        Mede o tempo de um trecho e soma ao tempo da etapa: with metricas.etapa('leitura_pdf'): ...
+        '''
+        inicio = perf_counter()
+        try:
+            yield
+        finally:
+            self.soma_etapa(nome, perf_counter() - inicio)
+
+    def soma_etapa(self, nome, segundos):
+        with self.lock:
+            self.etapas[nome] = self.etapas.get(nome, 0) + segundos
+
+    def latencia(self, nome, segundos, timeout=False):
+        '''
+        Registra a duração de uma espera (ex.: uma chamada a scrapy_bnmp ou a wait_element)
+        :param nome: tipo da espera
+        :param segundos: duração
+        :param timeout: se a espera terminou por timeout
+        '''
+        with self.lock:
+            self.latencias.setdefault(nome, []).append(segundos)
+            if timeout:
+                self.timeouts[nome] = self.timeouts.get(nome, 0) + 1
+
+    def conta(self, nome, quantidade=1):
+        with self.lock:
+            self.contadores[nome] = self.contadores.get(nome, 0) + quantidade
+
+    def define(self, nome, valor):
+        with self.lock:
+            self.contadores[nome] = valor
+
+    def relatorio(self) -> dict:
+        '''
+        :return: dict com todas as métricas da execução até o momento
+        '''
+        with self.lock:
+            relatorio = {
+                'data': self.data,
+                'tempo_total': perf_counter() - self.inicio,
+                'etapas': dict(self.etapas),
+                'latencias': {nome: resume_latencias(valores, self.timeouts.get(nome, 0))
+                              for nome, valores in self.latencias.items()},
+                'contadores': dict(self.contadores),
+            }
+        pico = self.pico_memoria
+        if pico is None:
+            pico = self._pico_memoria()
+        if pico is not None:
+            relatorio['pico_memoria_mb'] = pico / 2 ** 20
+            relatorio['medicao_memoria'] = self.memoria
+        return relatorio
+
+    def _pico_memoria(self):
+        if self.memoria == 'rss':
+            return pico_rss()
+        if self.memoria == 'tracemalloc' and tracemalloc.is_tracing():
+            return tracemalloc.get_traced_memory()[1]
+        return None
+
+    def encerra(self):
+        '''
+        Guarda o pico de memória e para o tracemalloc, se foi iniciado por estas métricas
+        '''
+        if self.pico_memoria is None:
+            self.pico_memoria = self._pico_memoria()
+        if self.rastreia:
+            tracemalloc.stop()
+            self.rastreia = False
+
+    def grava(self, caminho):
+        '''
+        Grava o relatório em JSON
+        :param caminho: caminho do arquivo (ex.: ao lado do .docx gerado)
+        '''
+        self.encerra()
+        with open(caminho, 'w', encoding='utf-8') as arq:
+            json.dump(self.relatorio(), arq, indent=2, ensure_ascii=False)
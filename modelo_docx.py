@@ -0,0 +1,202 @@
+'''
+Compilação e preenchimento do modelo Word (.docx) em uma única passada.
+
+O modelo é lido uma vez pelo MailMerge (que identifica os campos de mesclagem) e convertido em uma lista de
+trechos de XML já serializados, intercalados com os campos (nome_agente, date_doc, ...) e com as linhas
+repetidas das tabelas (a linha que contém o campo pNN_idx). O resultado da compilação fica gravado em disco,
+identificado pelo hash do arquivo modelo, e as execuções seguintes não precisam ler o XML do modelo.
+
+O documento gerado é o mesmo de MailMerge.merge + merge_rows + write.
+'''
+from os import makedirs, path
+from xml.sax.saxutils import escape
+from zipfile import ZipFile, ZIP_DEFLATED
+import hashlib
+import pickle
+import re
+
+from lxml import etree
+from lxml.etree import Element
+from mailmerge import MailMerge, NAMESPACES
+
+DIR_CACHE = path.join(path.dirname(path.abspath(__file__)), '.cache_modelo')
+
+# Versão do formato compilado; alterar invalida os modelos já gravados em cache
+VERSAO = 1
+
+SUFIXO_LINHA = '_idx'
+RE_LINHA = re.compile(r'<!--LINHA:([^>]*?)-->(.*?)<!--/LINHA-->', re.S)
+RE_CAMPO = re.compile(r'<CampoModelo nome="([^"]*)"/>')
+
+
+def hash_arquivo(caminho) -> str:
+    with open(caminho, 'rb') as arq:
+        return hashlib.sha256(arq.read()).hexdigest()
+
+
+def _divide_campos(xml: str) -> list:
+    '''
+    Divide um trecho de XML serializado em textos fixos e campos ('campo', nome)
+    '''
+    trechos = []
+    inicio = 0
+    for m in RE_CAMPO.finditer(xml):
+        trechos.append(xml[inicio:m.start()])
+        trechos.append(('campo', m.group(1)))
+        inicio = m.end()
+    trechos.append(xml[inicio:])
+    return [t for t in trechos if t != '']
+
+
+def _compila_parte(raiz) -> tuple:
+    '''
+    Converte uma parte do documento (já processada pelo MailMerge) em trechos de texto, campos e linhas repetidas
+    :param raiz: elemento raiz da parte (document.xml, header, footer)
+    :return: tupla (prefixo do namespace w, lista de trechos)
+    '''
+    w = NAMESPACES['w']
+    prefixo = {uri: p for p, uri in raiz.nsmap.items()}.get(w, 'w')
+
+    # Marca as linhas de tabela que se repetem (as que contém um campo terminado em _idx)
+    for tabela in raiz.iter('{%s}tbl' % w):
+        for linha in list(tabela):
+            ancoras = [mf.attrib['name'] for mf in linha.iter('MergeField')
+                       if mf.attrib['name'].endswith(SUFIXO_LINHA)]
+            if len(ancoras) > 0:
+                linha.addprevious(etree.Comment('LINHA:' + ancoras[0]))
+                linha.addnext(etree.Comment('/LINHA'))
+
+    # Transforma cada campo no mesmo <w:r> que o MailMerge monta, com um marcador no lugar do texto
+    for mf in list(raiz.iter('MergeField')):
+        nome = mf.attrib['name']
+        filhos = list(mf)
+        mf.clear()
+        mf.tag = '{%s}r' % w
+        mf.extend(filhos)
+        marcador = Element('CampoModelo', nome=nome)
+        ph = mf.find('MergeText')
+        if ph is not None:
+            ph.addprevious(marcador)
+            mf.remove(ph)
+        else:
+            mf.append(marcador)
+
+    xml = etree.tostring(raiz).decode('ascii')
+    trechos = []
+    inicio = 0
+    for m in RE_LINHA.finditer(xml):
+        trechos.extend(_divide_campos(xml[inicio:m.start()]))
+        trechos.append(('linha', m.group(1), _divide_campos(m.group(2))))
+        inicio = m.end()
+    trechos.extend(_divide_campos(xml[inicio:]))
+    return prefixo, trechos
+
+
+def compila_modelo(template) -> dict:
+    '''
+    Funcao que compila o modelo Word
+    :param template: caminho do arquivo modelo (.docx)
+    :return: dict com as partes compiladas e as partes alteradas pelo MailMerge (settings)
+    '''
+    with MailMerge(template) as documento:
+        compilado = {'versao': VERSAO, 'partes': {}, 'fixas': {}}
+        for zi, parte in documento.parts.items():
+            compilado['partes'][zi.filename] = _compila_parte(parte.getroot())
+        if documento.settings is not None:
+            compilado['fixas'][documento._settings_info.filename] = etree.tostring(documento.settings.getroot())
+    return compilado
+
+
+class ModeloDocx:
+    '''
+    Modelo Word compilado, com cache em disco identificado pelo hash do arquivo
+    :param template: caminho do arquivo modelo (.docx)
+    :param dir_cache: diretorio onde os modelos compilados são gravados (None desativa o cache)
+    '''
+
+    def __init__(self, template, dir_cache=DIR_CACHE):
+        self.template = template
+        self.compilado = None
+
+        arquivo_cache = None
+        if dir_cache is not None:
+            arquivo_cache = path.join(dir_cache, 'modelo-{}.pickle'.format(hash_arquivo(template)))
+            if path.exists(arquivo_cache):
+                with open(arquivo_cache, 'rb') as arq:
+                    compilado = pickle.load(arq)
+                if compilado.get('versao') == VERSAO:
+                    self.compilado = compilado
+
+        if self.compilado is None:
+            self.compilado = compila_modelo(template)
+            if arquivo_cache is not None:
+                makedirs(dir_cache, exist_ok=True)
+                with open(arquivo_cache, 'wb') as arq:
+                    pickle.dump(self.compilado, arq, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def campos(self) -> set:
+        '''
+        :return: nomes de todos os campos de mesclagem do modelo
+        '''
+        nomes = set()
+
+        def coleta(trechos):
+            for trecho in trechos:
+                if isinstance(trecho, tuple):
+                    if trecho[0] == 'campo':
+                        nomes.add(trecho[1])
+                    else:
+                        coleta(trecho[2])
+
+        for _, trechos in self.compilado['partes'].values():
+            coleta(trechos)
+        return nomes
+
+    def renderiza(self, destino, campos=None, linhas=None):
+        '''
+        Gera o documento preenchido em uma única passada pelos trechos compilados
+        :param destino: caminho do arquivo .docx gerado
+        :param campos: dict {campo: valor} dos campos fora das linhas repetidas (ex.: nome_agente, date_doc)
+        :param linhas: dict {ancora: [dict por linha]}, ex.: {'p01_idx': merge_content}, como em merge_rows
+        '''
+        campos = campos or {}
+        linhas = linhas or {}
+
+        partes = {}
+        for nome_parte, (prefixo, trechos) in self.compilado['partes'].items():
+            saida = []
+            self._renderiza_trechos(trechos, campos, linhas, prefixo, saida)
+            partes[nome_parte] = ''.join(saida).encode('utf-8')
+        partes.update(self.compilado['fixas'])
+
+        with ZipFile(self.template) as origem, ZipFile(destino, 'w', ZIP_DEFLATED) as saida:
+            for zi in origem.filelist:
+                if zi.filename in partes:
+                    saida.writestr(zi.filename, partes[zi.filename])
+                else:
+                    saida.writestr(zi.filename, origem.read(zi))
+
+    def _renderiza_trechos(self, trechos, campos, linhas, prefixo, saida):
+        for trecho in trechos:
+            if isinstance(trecho, str):
+                saida.append(trecho)
+            elif trecho[0] == 'campo':
+                saida.append(texto_campo(campos.get(trecho[1], ''), prefixo))
+            else:
+                # Linha repetida: uma cópia por registro; sem registros a linha fica com os campos vazios
+                for valores in linhas.get(trecho[1]) or [{}]:
+                    self._renderiza_trechos(trecho[2], dict(campos, **valores), {}, prefixo, saida)
+
+
+def texto_campo(texto, prefixo='w') -> str:
+    '''
+    Funcao que monta o XML do texto de um campo, com quebras de linha (<w:br/>) nos '\\n', como no MailMerge
+    :param texto: valor do campo
+    :param prefixo: prefixo do namespace w no documento
+    :return: str
+    '''
+    texto = texto or ''  # text might be None
+    nos = []
+    for parte in str(texto).replace('\r', '').split('\n'):
+        nos.append('<{0}:t>{1}</{0}:t>'.format(prefixo, escape(parte)) if parte else '<{0}:t/>'.format(prefixo))
+    return '<{}:br/>'.format(prefixo).join(nos)
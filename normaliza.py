@@ -0,0 +1,55 @@
+'''
+Normalização dos nomes de presos e mães para comparação: remoção de acentos, do sufixo entre parenteses
+(apelidos, ex.: "FULANO DE TAL (VULGO X)"), dos espaços repetidos e conversão para maiúsculas.
+
+A mesma regra é aplicada de forma vetorizada sobre o DataFrame de presos (normaliza_colunas) e a cada nome
+lido no resultado do BNMP (normaliza_nome, que guarda os nomes já normalizados).
+'''
+from functools import lru_cache
+import unicodedata
+
+
+@lru_cache(maxsize=100000)
+def normaliza_nome(nome) -> str:
+    '''
+    Funcao que normaliza um nome para comparação
+    :param nome: nome como consta no PDF ou no resultado do BNMP
+    :return: str
+    '''
+    nome = str(nome).split('(')[0]
+    nome = unicodedata.normalize('NFKD', nome).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(nome.upper().split())
+
+
+def normaliza_serie(serie):
+    '''
+    Funcao que aplica a regra de normaliza_nome sobre uma Series inteira, com operações vetorizadas do pandas
+    :param serie: Series de nomes
+    :return: Series
+    '''
+    return (serie.astype(str)
+            .str.replace(r'\(.*$', '', regex=True)
+            .str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+            .str.upper()
+            .str.replace(r'\s+', ' ', regex=True)
+            .str.strip())
+
+
+def normaliza_colunas(df):
+    '''
+    Cria as colunas 'nome_norm' e 'mae_norm' com os nomes normalizados do preso e da mãe
+    :param df: DataFrame de presos tratado por trata_df_pdf
+    :return: DataFrame
+    '''
+    return df.assign(nome_norm=normaliza_serie(df['nome_preso']), mae_norm=normaliza_serie(df['nome_mae']))
+
+
+def pecas_do_preso(linhas, nome_preso: str) -> list:
+    '''
+    Funcao que filtra as linhas do resultado do BNMP que pertencem ao preso pesquisado
+    :param linhas: lista de tuplas (numero, nome, orgao) do resultado
+    :param nome_preso: Nome do Preso pesquisado
+    :return: lista de tuplas (numero, orgao)
+    '''
+    alvo = normaliza_nome(nome_preso)
+    return [(numero, orgao) for numero, nome, orgao in linhas if normaliza_nome(nome) == alvo]
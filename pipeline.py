@@ -0,0 +1,365 @@
+'''
+Pipeline assíncrono (asyncio) que sobrepõe as três etapas do script: leitura do PDF, consultas ao BNMP e
+montagem/geração dos documentos.
+
+    leitura do PDF --(fila)--> consultas ao BNMP --(fila)--> montagem das linhas de cada posto --> documentos
+
+A leitura (tabula) roda em uma thread, as consultas seguem no pool/cliente do BNMP (submete devolve um
+concurrent.futures.Future) e cada linha é montada assim que a sua consulta termina. As consultas são enviadas
+por ordem de prioridade: rotas na ordem informada (a primeira a sair primeiro) e, dentro de cada rota, postos na
+ordem da tabela de rotas; a fila dos presos lidos é uma fila de prioridade e apenas algumas consultas ficam em
+andamento de cada vez, para que um preso de uma rota prioritária lido depois passe à frente dos demais. Com a
+lista inteira já em memória, todos os presos entram na fila antes da primeira consulta e a prioridade vale para
+a lista toda; na leitura incremental (leitura_incremental) a fila é limitada a tamanho_fila presos e a
+prioridade vale dentro dessa janela de leitura antecipada, o que mantém a memória limitada.
+Terminada a leitura, um posto é finalizado quando todas as suas consultas terminam, e cada documento é gerado
+(em uma thread) assim que os postos das suas rotas ficam prontos, enquanto as consultas dos demais postos continuam.
+
+Com prazos, uma consulta que passa do prazo por consulta (ou que falha) fica pendente e é repetida no fim,
+se o prazo total permitir; no prazo total as consultas que ainda não terminaram ficam como PENDENTE e os
+documentos são gerados com os resultados disponíveis.
+'''
+import asyncio
+
+FIM = None  # marca o fim da fila
+
+# Resultado das consultas que não terminaram no prazo ou falharam (distinto de 'NC', sem mandados)
+PENDENTE = 'PENDENTE'
+
+
+class PrazoEsgotado(Exception):
+    '''
+    O prazo total da execução terminou antes de a consulta ser enviada
+    '''
+
+
+def monta_linha(preso: dict, i: int, resultado: str) -> dict:
+    '''
+    Funcao que monta a linha do preso na tabela do posto, no formato de merge_rows
+    :param preso: registro do preso (com as colunas dp e nome_preso)
+    :param i: posição do preso na lista do posto (a partir de 0)
+    :param resultado: resultado da consulta ao BNMP
+    :return: dict {campo: valor}
+    '''
+    return {
+        str(preso['dp']) + '_idx': '0' + str(i + 1) if (i + 1) < 10 else str(i + 1),
+        str(preso['dp']) + '_nome': preso['nome_preso'],
+        str(preso['dp']) + '_ip': '',
+        str(preso['dp']) + '_mp': 'NÃO',
+        str(preso['dp']) + '_mlj': 'NÃO',
+        str(preso['dp']) + '_cs': 'NÃO',
+        str(preso['dp']) + '_bnmp': resultado
+    }
+
+
+class PipelineEscolta:
+    '''
+    Pipeline leitura -> consultas -> documentos
+    :param submete: função (nome_preso, nome_mae) -> concurrent.futures.Future (PoolBNMP.submete ou
+        ClienteBNMP.submete)
+    :param rotas: rotas do dia, na ordem de prioridade; presos de outras rotas são descartados na leitura
+    :param trabalhos: lista de trabalhos (ver lote.py); cada um é entregue a gera_documento quando fica pronto
+    :param gera_documento: função (trabalho, linhas_dp) chamada em uma thread para gerar o documento
+    :param tamanho_fila: capacidade da fila entre as consultas e a montagem das linhas e, na leitura incremental,
+        da fila entre a leitura e as consultas (janela em que a prioridade é aplicada)
+    :param metricas: Metricas opcional; registra o tempo de leitura do PDF ('leitura_pdf'), a espera de cada
+        consulta ('consulta_bnmp') e as linhas por posto
+    :param prazo_consulta: tempo máximo (em segundos) de espera pelo resultado de cada consulta
+    :param prazo_total: tempo máximo (em segundos) da execução, a partir do início de executa
+    :param postos_por_rota: dict {rota: [postos na ordem de prioridade]} (TabelaRotas.postos_por_rota)
+    :param em_andamento: quantidade máxima de consultas enviadas e não terminadas (padrão: tamanho_fila); as
+        demais aguardam na fila de prioridade. Uma consulta que passa do prazo por consulta deixa de contar
+    :param guarda_registros: guarda todos os presos lidos para registros() (ex.: arquivo histórico); sem ele
+        apenas os presos das rotas ficam em memória, nas linhas dos postos
+    :param leitura_incremental: os presos são lidos aos poucos (ex.: extrai_presos_stream); senão a lista é lida
+        inteira antes das consultas
+    '''
+
+    def __init__(self, submete, rotas, trabalhos=None, gera_documento=None, tamanho_fila=64, metricas=None,
+                 prazo_consulta=None, prazo_total=None, postos_por_rota=None, em_andamento=None,
+                 guarda_registros=True, leitura_incremental=False):
+        self.submete = submete
+        self.rotas = set(rotas)
+        self.ordem_rotas = {rota: r for r, rota in enumerate(rotas)}
+        self.ordem_postos = {posto: (self.ordem_rotas[rota], p) for rota, postos in (postos_por_rota or {}).items()
+                             if rota in self.ordem_rotas for p, posto in enumerate(postos)}
+        self.max_em_andamento = em_andamento or tamanho_fila
+        self.trabalhos = trabalhos or []
+        self.gera_documento = gera_documento
+        self.tamanho_fila = tamanho_fila
+        self.metricas = metricas
+        self.prazo_consulta = prazo_consulta
+        self.prazo_total = prazo_total
+        self.guarda_registros = guarda_registros
+        self.leitura_incremental = leitura_incremental
+
+        self.presos = []  # todos os presos lidos do PDF, de todas as rotas (com guarda_registros)
+        self.lidos = 0
+        self.linhas_dp = {}  # {'pNN_idx': [linha, ...]} na ordem do PDF
+        self.rota_dp = {}  # {'pNN_idx': rota}
+        self.pendentes = {}  # consultas ainda não terminadas de cada posto
+        self.finalizados = set()
+        self.consultas_unicas = {}
+        self.com_vaga = set()  # consultas que ainda ocupam uma vaga entre as consultas em andamento
+        self.resultados = {}  # {(nome_norm, mae_norm): resultado} das linhas já preenchidas
+        self.adiadas = []  # (ancora, i, preso) das linhas cuja consulta ficou pendente
+        self.pendentes_dp = {}  # {'pNN_idx': [(i, preso), ...]} das linhas preenchidas com PENDENTE
+        self.repetidos = 0
+        self.leitura_concluida = False
+
+    async def executa(self, presos) -> dict:
+        '''
+        Executa o pipeline sobre os presos
+        :param presos: iterável (lista ou gerador, ex.: extrai_presos_stream) de registros de presos, na ordem do PDF
+        :return: dict {'pNN_idx': [linha, ...]} com as linhas de todos os postos
+        '''
+        self.loop = asyncio.get_running_loop()
+        self.limite = self.loop.time() + self.prazo_total if self.prazo_total is not None else None
+        # Na leitura incremental a prioridade é aplicada dentro da janela dos presos lidos e ainda não enviados
+        self.fila_presos = asyncio.PriorityQueue(self.tamanho_fila if self.leitura_incremental else 0)
+        self.fila_linhas = asyncio.Queue(self.tamanho_fila)
+        self.tarefas_linhas = set()
+        self.documentos = []
+        # Limita as consultas em andamento: as demais aguardam na fila de prioridade
+        self.em_andamento = asyncio.Semaphore(self.max_em_andamento)
+
+        await asyncio.gather(self._le(presos), self._consulta(), self._monta())
+        await self._repete_adiadas()
+        await asyncio.gather(*self.documentos)
+
+        # As consultas que ainda aguardam na fila não são mais necessárias
+        for consulta in self.consultas_unicas.values():
+            if not consulta.done():
+                consulta.cancel()
+        if self.metricas is not None:
+            self.metricas.define('linhas_por_posto', {ancora[:-len('_idx')]: len(linhas)
+                                                     for ancora, linhas in sorted(self.linhas_dp.items())})
+            self.metricas.define('consultas_unicas', len(self.consultas_unicas))
+            self.metricas.define('presos_repetidos', self.repetidos)
+            self.metricas.define('linhas_pendentes', sum(len(linhas) for linhas in self.pendentes_dp.values()))
+        return self.linhas_dp
+
+    def registros(self) -> list:
+        '''
+        :return: lista de dicts, um por preso lido do PDF (de todas as rotas), com o resultado da consulta na
+            chave 'bnmp' (None para os presos de rotas não consultadas)
+        '''
+        return [dict(preso, bnmp=self.resultados.get((preso['nome_norm'], preso['mae_norm'])))
+                for preso in self.presos]
+
+    def presos_pendentes(self, ancoras) -> list:
+        '''
+        :param ancoras: postos ('pNN_idx')
+        :return: lista de dicts dos presos desses postos cuja consulta ficou PENDENTE, na ordem do documento
+        '''
+        return [preso for ancora in ancoras for _, preso in sorted(self.pendentes_dp.get(ancora, []),
+                                                                     key=lambda item: item[0])]
+
+    def _restante(self):
+        # Tempo restante até o prazo total (None sem prazo total)
+        return None if self.limite is None else max(0.0, self.limite - self.loop.time())
+
+    def _prazo(self, prazo):
+        # Tempo de espera limitado pelo prazo informado e pelo prazo total
+        restante = self._restante()
+        if prazo is None or restante is None:
+            return restante if prazo is None else prazo
+        return min(prazo, restante)
+
+    def _proximo(self, iterador):
+        if self.metricas is None:
+            return next(iterador, FIM)
+        with self.metricas.etapa('leitura_pdf'):
+            return next(iterador, FIM)
+
+    def _prioridade(self, preso) -> tuple:
+        # Ordem da rota e do posto dentro da rota; postos fora da tabela vão para o fim da sua rota
+        return self.ordem_postos.get(preso['dp'], (self.ordem_rotas[preso['rota']], len(self.ordem_postos)))
+
+    def _le_todos(self, presos) -> list:
+        if self.metricas is None:
+            return list(presos)
+        with self.metricas.etapa('leitura_pdf'):
+            return list(presos)
+
+    async def _le(self, presos):
+        # O tabula e o pandas bloqueiam: a leitura é feita em uma thread, registro a registro na leitura
+        # incremental. Sem ela todos os presos entram na fila antes da primeira consulta
+        if not self.leitura_incremental:
+            presos = await self.loop.run_in_executor(None, self._le_todos, presos)
+        iterador = iter(presos)
+        while True:
+            if self.leitura_incremental:
+                preso = await self.loop.run_in_executor(None, self._proximo, iterador)
+            else:
+                preso = next(iterador, FIM)
+            if preso is FIM:
+                break
+            self.lidos += 1
+            if self.guarda_registros:
+                self.presos.append(preso)
+            if preso['rota'] in self.rotas:
+                # As linhas de cada posto são contadas na leitura: o posto só é finalizado quando todas terminam,
+                # mesmo as que ainda aguardam na fila de prioridade
+                ancora = str(preso['dp']) + '_idx'
+                self.rota_dp[ancora] = preso['rota']
+                self.pendentes[ancora] = self.pendentes.get(ancora, 0) + 1
+                # O número de leitura desempata a prioridade e mantém a ordem do PDF dentro do posto
+                await self.fila_presos.put((self._prioridade(preso), self.lidos, preso))
+        await self.fila_presos.put(((len(self.ordem_rotas), 0), self.lidos + 1, FIM))
+
+        # Fim da leitura: nenhum posto recebe novas linhas
+        self.leitura_concluida = True
+        for ancora in list(self.pendentes):
+            self._verifica_posto(ancora)
+        self._verifica_trabalhos()
+
+    async def _consulta(self):
+        # O mesmo preso listado mais de uma vez é consultado uma única vez
+        while True:
+            # A vaga é obtida antes de retirar o preso, para que ele seja o mais prioritário no momento do envio
+            vaga = await self._vaga()
+            preso = (await self.fila_presos.get())[-1]
+            if preso is FIM:
+                break
+            chave = (preso['nome_norm'], preso['mae_norm'])
+            if chave in self.consultas_unicas:
+                self.repetidos += 1
+                if vaga:
+                    self.em_andamento.release()
+            elif vaga:
+                consulta = asyncio.wrap_future(self.submete(preso['nome_preso'], preso['nome_mae']))
+                self.com_vaga.add(consulta)
+                consulta.add_done_callback(self._consulta_terminada(self.loop.time()))
+                self.consultas_unicas[chave] = consulta
+            else:
+                consulta = self.loop.create_future()
+                consulta.set_exception(PrazoEsgotado())
+                self.consultas_unicas[chave] = consulta
+            await self.fila_linhas.put((preso, self.consultas_unicas[chave]))
+        await self.fila_linhas.put(FIM)
+
+    async def _vaga(self) -> bool:
+        # Aguarda uma vaga entre as consultas em andamento; False se o prazo total terminar antes
+        try:
+            await asyncio.wait_for(self.em_andamento.acquire(), self._restante())
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def _libera_vaga(self, consulta):
+        # A vaga é liberada uma única vez: quando a consulta termina ou quando passa do prazo por consulta
+        if consulta in self.com_vaga:
+            self.com_vaga.discard(consulta)
+            self.em_andamento.release()
+
+    def _consulta_terminada(self, inicio):
+        def terminada(consulta):
+            self._libera_vaga(consulta)
+            if self.metricas is not None:
+                self.metricas.latencia('consulta_bnmp', self.loop.time() - inicio)
+        return terminada
+
+    async def _monta(self):
+        while True:
+            item = await self.fila_linhas.get()
+            if item is FIM:
+                break
+            preso, consulta = item
+            ancora = str(preso['dp']) + '_idx'
+            linhas = self.linhas_dp.setdefault(ancora, [])
+            linhas.append(None)
+            tarefa = asyncio.ensure_future(self._preenche(ancora, len(linhas) - 1, preso, consulta))
+            self.tarefas_linhas.add(tarefa)
+            tarefa.add_done_callback(self.tarefas_linhas.discard)
+        await asyncio.gather(*list(self.tarefas_linhas))
+
+    async def _aguarda(self, consultas, prazo, nome_preso):
+        '''
+        Aguarda, até o prazo, a primeira das consultas (a original e a repetida) que terminar com sucesso
+        :return: resultado ou None se nenhuma terminou com sucesso no prazo
+        '''
+        aguardando = set(consultas)
+        limite = None if prazo is None else self.loop.time() + prazo
+        while len(aguardando) > 0:
+            espera = None if limite is None else max(0.0, limite - self.loop.time())
+            terminadas, aguardando = await asyncio.wait(aguardando, timeout=espera,
+                                                        return_when=asyncio.FIRST_COMPLETED)
+            for consulta in terminadas:
+                if consulta.cancelled():
+                    continue
+                if consulta.exception() is None:
+                    return consulta.result()
+                if not isinstance(consulta.exception(), PrazoEsgotado):
+                    print('Falha na consulta de {}: {}'.format(nome_preso, consulta.exception()), end='\n')
+            if len(terminadas) == 0:
+                break
+        return None
+
+    async def _preenche(self, ancora, i, preso, consulta):
+        resultado = await self._aguarda([consulta], self._prazo(self.prazo_consulta), preso['nome_preso'])
+        if resultado is None:
+            # Fora do prazo ou com falha: a linha é repetida no fim, se houver tempo. Uma consulta travada deixa
+            # de ocupar a vaga, para que as seguintes sejam enviadas
+            self._libera_vaga(consulta)
+            self.adiadas.append((ancora, i, preso))
+            return
+        self._completa(ancora, i, preso, resultado)
+
+    async def _repete_adiadas(self):
+        '''
+        Repete, se o prazo total permitir, as consultas pendentes e preenche as suas linhas, com PENDENTE as que
+        não terminarem
+        '''
+        if len(self.adiadas) == 0:
+            return
+        presos = {}
+        for _, _, preso in self.adiadas:
+            presos.setdefault((preso['nome_norm'], preso['mae_norm']), preso)
+        print('Repetindo {} consultas pendentes'.format(len(presos)), end='\n')
+
+        async def repete(chave, preso):
+            original = self.consultas_unicas[chave]
+            # A consulta original ainda pode terminar; a que já falhou não é aguardada de novo
+            consultas = [original] if not original.done() else []
+            if self._restante() != 0:
+                consultas.append(asyncio.wrap_future(self.submete(preso['nome_preso'], preso['nome_mae'])))
+            resultado = await self._aguarda(consultas, self._prazo(self.prazo_consulta), preso['nome_preso'])
+            for consulta in consultas:
+                if consulta is not original:
+                    consulta.cancel()
+            return resultado
+
+        resultados = await asyncio.gather(*[repete(chave, preso) for chave, preso in presos.items()])
+        resultados = dict(zip(presos, resultados))
+        for ancora, i, preso in self.adiadas:
+            resultado = resultados[(preso['nome_norm'], preso['mae_norm'])]
+            self._completa(ancora, i, preso, PENDENTE if resultado is None else resultado)
+
+    def _completa(self, ancora, i, preso, resultado):
+        if resultado == PENDENTE:
+            self.pendentes_dp.setdefault(ancora, []).append((i, preso))
+        self.resultados[(preso['nome_norm'], preso['mae_norm'])] = resultado
+        self.linhas_dp[ancora][i] = monta_linha(preso, i, resultado)
+        self.pendentes[ancora] -= 1
+        if self._verifica_posto(ancora):
+            self._verifica_trabalhos()
+
+    def _verifica_posto(self, ancora) -> bool:
+        if self.leitura_concluida and self.pendentes[ancora] == 0 and ancora not in self.finalizados:
+            self.finalizados.add(ancora)
+            return True
+        return False
+
+    def _verifica_trabalhos(self):
+        '''
+        Gera, em uma thread, o documento de cada trabalho cujos postos estão todos finalizados
+        '''
+        if self.gera_documento is None:
+            return
+        for trabalho in list(self.trabalhos):
+            postos = [ancora for ancora, rota in self.rota_dp.items() if rota in trabalho['rotas']]
+            if all(ancora in self.finalizados for ancora in postos):
+                self.trabalhos.remove(trabalho)
+                linhas = {ancora: self.linhas_dp[ancora] for ancora in postos}
+                self.documentos.append(self.loop.run_in_executor(None, self.gera_documento, trabalho, linhas))
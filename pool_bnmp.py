@@ -0,0 +1,110 @@
+'''
+Pool de sessoes do navegador para consultas paralelas ao BNMP.
+
+Cada sessao (thread) abre o seu proprio web driver e retira as consultas de uma fila compartilhada.
+As consultas sao submetidas com PoolBNMP.submete, que devolve um concurrent.futures.Future; guardando os
+futures na ordem das linhas de cada DP os resultados sao remontados na ordem original.
+'''
+from concurrent.futures import Future
+import queue
+import threading
+import time
+
+
+class PoolBNMP:
+    '''
+    Pool de sessoes do navegador que consomem uma fila de consultas ao BNMP
+    :param abre_sessao: função sem parametros que cria um web driver pronto para pesquisar
+    :param consulta: função de consulta com a assinatura (drv, nome_preso, nome_mae) -> str
+    :param n_sessoes: quantidade de sessoes (navegadores) abertas em paralelo
+    '''
+
+    def __init__(self, abre_sessao, consulta, n_sessoes=1):
+        self.abre_sessao = abre_sessao
+        self.consulta = consulta
+        self.fila = queue.Queue()
+        self.lock = threading.Lock()
+        self.ativas = n_sessoes
+        self.erro_sessao = None
+        self.sessoes = [threading.Thread(target=self._trabalha, name='bnmp-{}'.format(i + 1), daemon=True)
+                        for i in range(n_sessoes)]
+        for sessao in self.sessoes:
+            sessao.start()
+
+    def _trabalha(self):
+        try:
+            drv = self.abre_sessao()
+        except Exception as e:
+            print('Erro ao abrir a sessao {}: {}'.format(threading.current_thread().name, e))
+            with self.lock:
+                self.ativas -= 1
+                self.erro_sessao = e
+                sem_sessoes = self.ativas == 0
+            if sem_sessoes:
+                self._cancela_pendentes()
+            return
+
+        try:
+            while True:
+                item = self.fila.get()
+                if item is None:
+                    break
+                futuro, nome_preso, nome_mae = item
+                if not futuro.set_running_or_notify_cancel():
+                    continue
+                try:
+                    futuro.set_result(self.consulta(drv, nome_preso, nome_mae))
+                except Exception as e:
+                    futuro.set_exception(e)
+        finally:
+            drv.quit()
+
+    def _cancela_pendentes(self):
+        '''
+        Falha as consultas que ainda estão na fila quando nenhuma sessao conseguiu ser aberta
+        '''
+        while True:
+            try:
+                item = self.fila.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item[0].set_running_or_notify_cancel():
+                item[0].set_exception(RuntimeError('Nenhuma sessao do BNMP disponivel: {}'.format(self.erro_sessao)))
+
+    def submete(self, nome_preso: str, nome_mae: str) -> Future:
+        '''
+        Coloca uma consulta na fila das sessoes
+        :param nome_preso: Nome do Preso
+        :param nome_mae: Nome da Mãe do Preso
+        :return: Future com o resultado da consulta
+        '''
+        futuro = Future()
+        self.fila.put((futuro, nome_preso, nome_mae))
+        with self.lock:
+            sem_sessoes = self.ativas == 0
+        if sem_sessoes:
+            self._cancela_pendentes()
+        return futuro
+
+    def disponivel(self) -> bool:
+        '''
+        :return: True se alguma sessao está aberta (ou abrindo) e pode atender as consultas
+        '''
+        with self.lock:
+            ativas = self.ativas
+        return ativas > 0 and any(sessao.is_alive() for sessao in self.sessoes)
+
+    def encerra(self, espera=30):
+        '''
+        Aguarda o fim das consultas em andamento e fecha os navegadores
+        :param espera: tempo máximo (em segundos) de espera pelas sessoes; uma sessao travada em uma consulta é
+            abandonada (as threads sao daemon e não impedem o fim do processo)
+        '''
+        for _ in self.sessoes:
+            self.fila.put(None)
+        limite = time.monotonic() + espera
+        for sessao in self.sessoes:
+            sessao.join(max(0.0, limite - time.monotonic()))
+        travadas = [sessao.name for sessao in self.sessoes if sessao.is_alive()]
+        if len(travadas) > 0:
+            print('Sessoes do BNMP abandonadas sem resposta: {}'.format(', '.join(travadas)))
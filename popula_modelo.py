@@ -1,263 +1,551 @@
+'''
+Processa a lista de presos do SISPEN e preenche o arquivo world (.docx) com o modelo de pesquisa diária de
+incidência penal, mandados a cumprir e antecedentes por crimes sexuais, conforme as rotas indicadas.
+
+Modos (subcomandos):
+    pdf   - apenas lê e trata o PDF, exibindo os presos por rota e posto (e gravando-os em CSV com --saida)
+    word  - preenche o modelo Word sem consultar o BNMP (campo BNMP com 'NC'); é o modo padrão
+    bnmp  - preenche o modelo Word com a consulta de cada preso ao BNMP
+
+As bibliotecas pesadas (pandas/tabula, lxml, selenium, aiohttp) só são importadas pela etapa que as usa, de modo
+que --help, a validação dos argumentos e o modo sem consulta ao BNMP não carregam o Selenium nem o aiohttp.
+
+Exemplo: python popula_modelo.py bnmp -r sul,leste --pdf solicitacoes.pdf --model modelo.docx
+'''
 from __future__ import print_function
-from mailmerge import MailMerge
 from datetime import date
-import tabula
-from numpy import nan
-import pandas as pd
-import argparse
 from os import path
+import argparse
 import sys
 
+MODOS = ['pdf', 'word', 'bnmp']
+MODO_PADRAO = 'word'
 
-# Setando as rotas do dia
-route_name = ['leste','oeste','sul']
+# Rotas do dia, quando não indicadas
+ROTAS_PADRAO = 'leste,oeste,sul'
 
-# Lendo os argumentos da linha de comando
-parser = argparse.ArgumentParser(description='Processa a lista de presos do SISPEN e preenche o arquivo world '
-                                             'com o modelo de pesquisa diária de incidência penal, mandados a cumprir'
-                                             'e antecedentes por crimes sexuais, conforme as rotas indicadas.')
-parser.add_argument("-c", "--cabecalho", help= "Caso deseje inserir dados de cabecalho: Nome do Agente, Matricula e Equipe", default=False)
-parser.add_argument("-r", "--rotas", help= "Nomes das rotas do dia separadas por ',' no formato: rota1,rota2,etc...", default='leste,oeste,sul')
-parser.add_argument("--pdf", required= True, help= "caminho relativo do arquivo pdf oriundo do SISPEN")
-parser.add_argument("--model", required= True, help= "caminho relativo do arquivo modelo em world para composição das rotas")
-args = parser.parse_args()
 
-# Setando o arquivo world com o modelo
-template = args.model
+# ----------------------------------
+# Tratando os argumentos da linha de comando
+# ----------------------------------
+def cria_parser():
+    '''
+    Funcao que monta o parser da linha de comando, com um subcomando por modo
+    :return: argparse.ArgumentParser
+    '''
+    parser = argparse.ArgumentParser(description='Processa a lista de presos do SISPEN e preenche o arquivo world '
+                                                 'com o modelo de pesquisa diária de incidência penal, mandados a '
+                                                 'cumprir e antecedentes por crimes sexuais, conforme as rotas '
+                                                 'indicadas. Sem subcomando, executa o modo "word".')
+    modos = parser.add_subparsers(dest='modo', metavar='{pdf,word,bnmp}')
+
+    # Opções da leitura do PDF, comuns a todos os modos
+    leitura = argparse.ArgumentParser(add_help=False)
+    leitura.add_argument("--pdf", required=True, help="caminho relativo do arquivo pdf oriundo do SISPEN")
+    leitura.add_argument("-r", "--rotas", default=ROTAS_PADRAO,
+                         help="Nomes das rotas do dia separadas por ',' no formato: rota1,rota2,etc...")
+    leitura.add_argument("--tabela-rotas",
+                         help="arquivo CSV com o mapeamento delegacia -> posto -> rota (padrao: rotas.csv)")
+    leitura.add_argument("--pdf-workers", type=int, default=1,
+                         help="quantidade de extracoes simultaneas das paginas do PDF pelo tabula")
+    leitura.add_argument("--colunas-pdf",
+                         help="posicoes (em pontos) das divisoes entre as colunas da tabela do PDF, separadas por ','"
+                              " (padrao: detectadas pelo cabecalho da tabela, uma vez por leiaute)")
+    leitura.add_argument("--leiautes-pdf", default='leiautes_pdf.json',
+                         help="arquivo JSON com as colunas dos leiautes de PDF ja detectados")
+    leitura.add_argument("--cache-paginas", default='sispen_paginas.sqlite3',
+                         help="caminho do arquivo SQLite com as paginas do PDF ja extraidas pelo tabula")
+    leitura.add_argument("--sem-cache-paginas", action='store_true',
+                         help="extrai todas as paginas do PDF, sem consultar nem gravar o cache de paginas")
+
+    # Opções da geração do documento Word (modos word e bnmp)
+    documento = argparse.ArgumentParser(add_help=False)
+    documento.add_argument("--model", required=True,
+                           help="caminho relativo do arquivo modelo em world para composição das rotas")
+    documento.add_argument("-c", "--cabecalho", default=False,
+                           help="Caso deseje inserir dados de cabecalho: Nome do Agente, Matricula e Equipe")
+    documento.add_argument("--agente", help="nome do agente no cabecalho (sem perguntar, como alternativa ao -c)")
+    documento.add_argument("--matricula", help="matricula do agente no cabecalho")
+    documento.add_argument("--equipe", help="numero da equipe no cabecalho")
+    documento.add_argument("--lote",
+                           help="arquivo JSON com varios trabalhos (rotas, agente, matricula, equipe, saida): o PDF e "
+                                "as consultas ao BNMP sao feitos uma unica vez e um documento e gerado por trabalho")
+    documento.add_argument("--stream", action='store_true',
+                           help="trata o PDF pagina a pagina, iniciando as consultas ao BNMP antes do fim da leitura")
+    documento.add_argument("--profile", action='store_true',
+                           help="registra o tempo de cada etapa, a latencia e os timeouts das consultas ao BNMP, as "
+                                "linhas por posto e o pico de memoria em um relatorio JSON ao lado do .docx gerado")
+    documento.add_argument("--metrics-out", help="caminho do relatorio JSON de metricas (implica --profile)")
+    documento.add_argument("--profile-memoria", action='store_true',
+                           help="mede o pico de memoria alocada pelo Python com o tracemalloc, que deixa a execucao "
+                                "mais lenta (implica --profile); sem ela e registrado o pico de memoria residente")
+    documento.add_argument("--doc-por-rota", action='store_true',
+                           help="grava um documento por rota (dd.mm.aaaa-rota.docx), cada um assim que as consultas "
+                                "da rota terminam; as rotas sao consultadas na ordem de -r")
+    documento.add_argument("--prazo-consulta", type=float, default=120,
+                           help="tempo maximo (em segundos) de espera pelo resultado de cada preso; depois dele o "
+                                "preso fica PENDENTE e a consulta e repetida no fim, se houver tempo")
+    documento.add_argument("--prazo-total", type=float,
+                           help="tempo maximo (em minutos) da execucao: no prazo o documento e gravado com os "
+                                "resultados disponiveis e a lista dos presos pendentes")
+    documento.add_argument("--historico", default='historico',
+                           help="diretorio do arquivo historico (Parquet) onde os presos da execucao sao acrescentados")
+    documento.add_argument("--sem-historico", action='store_true',
+                           help="nao acrescenta os presos da execucao ao arquivo historico")
+
+    pdf = modos.add_parser('pdf', parents=[leitura], help="apenas le e trata o PDF do SISPEN")
+    pdf.add_argument("--saida", help="grava os presos tratados neste arquivo CSV")
+
+    modos.add_parser('word', parents=[leitura, documento], help="preenche o modelo Word sem consultar o BNMP")
+
+    bnmp = modos.add_parser('bnmp', parents=[leitura, documento],
+                            help="preenche o modelo Word com a consulta de cada preso ao BNMP")
+    adiciona_opcoes_bnmp(bnmp)
+    bnmp.add_argument("--retoma", "--resume", action='store_true',
+                      help="retoma uma execucao interrompida sobre o mesmo PDF e as mesmas rotas: os presos ja "
+                           "consultados, registrados no diario da execucao, nao sao consultados de novo")
+    bnmp.add_argument("--diario", default='diario_consultas',
+                      help="diretorio dos diarios das consultas de cada execucao (um arquivo por PDF e rotas)")
+    return parser
+
+
+def adiciona_opcoes_bnmp(parser):
+    '''
+    Acrescenta ao parser as opções da consulta ao BNMP (cache, navegadores, API), usadas também pelo servidor.py
+    '''
+    parser.add_argument("--cache", default='bnmp_cache.sqlite3',
+                        help="caminho do arquivo SQLite com o cache das consultas ao BNMP")
+    parser.add_argument("--cache-ttl", type=float, default=24,
+                        help="validade, em horas, de um resultado gravado no cache do BNMP")
+    parser.add_argument("--cache-max", type=int, default=5000,
+                        help="quantidade maxima de presos mantidos no cache do BNMP")
+    parser.add_argument("--atualiza-cache", action='store_true',
+                        help="ignora o cache e refaz todas as consultas ao BNMP, atualizando os resultados gravados")
+    parser.add_argument("--bnmp-workers", type=int, default=1,
+                        help="quantidade de navegadores consultando o BNMP em paralelo (cada um exige validar o "
+                             "captcha)")
+    parser.add_argument("--bnmp-backend", choices=['navegador', 'api'], default='navegador',
+                        help="forma de consulta ao BNMP: pelo navegador (Selenium) ou por requisicoes diretas a API do "
+                             "portal, apos a validacao do captcha no navegador")
+    parser.add_argument("--bnmp-api-url", help="endereco da API de pesquisa do BNMP (backend 'api')")
+    parser.add_argument("--bnmp-concorrencia", type=int, default=4,
+                        help="teto de consultas simultaneas a API do BNMP (backend 'api'); a concorrencia comeca em 1 "
+                             "e se ajusta a resposta do portal sem passar do teto")
+    parser.add_argument("--bnmp-taxa", type=float, default=2.0,
+                        help="maximo de consultas por segundo ao BNMP")
+    parser.add_argument("--bnmp-tentativas", type=int, default=3,
+                        help="maximo de tentativas de cada consulta em timeouts e paginas de erro do portal")
+    parser.add_argument("--bnmp-latencia-alvo", type=float, default=5.0,
+                        help="latencia (em segundos) abaixo da qual a quantidade de consultas simultaneas aumenta")
+    parser.add_argument("--bnmp-timeout-max", type=float, default=60.0,
+                        help="maior tempo (em segundos) de espera de uma consulta; o tempo de espera acompanha a "
+                             "latencia do portal, a partir de 8 s")
+    parser.add_argument("--chromedriver", help="caminho do chromedriver (padrao: C:\\webdrivers\\chromedriver_92.exe)")
+
+
+def le_argumentos(argv=None):
+    '''
+    Funcao que interpreta a linha de comando; sem subcomando assume o modo padrão, mantendo a chamada antiga
+    (python popula_modelo.py -c 1 -r sul,leste --pdf ... --model ...)
+    :param argv: argumentos (padrão: sys.argv[1:])
+    :return: argparse.Namespace
+    '''
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if len(argv) > 0 and argv[0] not in MODOS and argv[0] not in ('-h', '--help'):
+        argv.insert(0, MODO_PADRAO)
+    parser = cria_parser()
+    args = parser.parse_args(argv)
+    if args.modo is None:
+        parser.print_help()
+        sys.exit(1)
+
+    arquivos = [args.pdf] + ([args.model] if args.modo != 'pdf' else [])
+    if not all(path.exists(arquivo) for arquivo in arquivos):
+        print('Erro: Arquivo PDF ou MODEL inexistentes. \nInforme o caminho relativo completo dos dois arquivos.',
+              end='\n')
+        sys.exit(1)
+    try:
+        if args.colunas_pdf is not None:
+            args.colunas_pdf = [float(coluna) for coluna in args.colunas_pdf.split(',')]
+    except ValueError:
+        parser.error('--colunas-pdf deve ser uma lista de numeros separados por ","')
+    return args
+
+
+def monta_trabalhos(args) -> tuple:
+    '''
+    Funcao que monta os documentos a gerar: os trabalhos do arquivo de lote ou um único, com o cabeçalho padrão
+    (ou informado pelo operador com -c); com --doc-por-rota, um documento por rota
+    :return: tupla (lista de trabalhos, rotas de todos os trabalhos na ordem de prioridade)
+    '''
+    trabalhos, route_name = _monta_trabalhos(args)
+    if args.doc_por_rota:
+        from lote import divide_por_rota
+        trabalhos = divide_por_rota(trabalhos)
+    return trabalhos, route_name
 
-# Setando o arquivo PDF
-pdf_path = args.pdf
 
-if not (path.exists(template) and path.exists(pdf_path)):
-    print('Erro: Arquivo PDF ou MODEL inexistentes. \nInforme o caminho relativo completo dos dois arquivos.', end='\n')
-    sys.exit(1)
+def _monta_trabalhos(args) -> tuple:
+    from lote import le_lote, uniao_rotas
 
-if args.rotas:
-    # Setando as rotas do dia
-    route_name = args.rotas.split(',')
+    if args.lote:
+        # Varios documentos (equipes) a partir da mesma leitura do PDF e das mesmas consultas
+        trabalhos = le_lote(args.lote)
+        return trabalhos, uniao_rotas(trabalhos)
+
+    # Setando as variaveis para o cabeçalho do modelo World
+    agente = args.agente or 'Renata'
+    matricula = args.matricula or '590010'
+    delivery = args.equipe or '3'
 
-# Setando as variaveis para o cabeçalho do modelo World
-agente = 'Renata'
-matricula = '590010'
-delivery = '3'
-data_plantao = '{:%d/%m/%Y}'.format(date.today())
+    if args.cabecalho:
+        agente = input('Insira o nome do Agente: ')
+        matricula = input('Insira a matricula do Agente: ')
+        delivery = input('Insira o num. da equipe: ')
 
-if args.cabecalho:
-    agente = input('Insira o nome do Agente: ')
-    matricula = input('Insira a matricula do Agente: ')
-    delivery = input('Insira o num. da equipe: ')
+    route_name = args.rotas.split(',')
+    return [dict(rotas=route_name, agente=agente, matricula=matricula, equipe=delivery,
+                 saida='./{:%d.%m.%Y}.docx'.format(date.today()))], route_name
 
 
 # ---------------------------------
 # Tratando o PDF
 # ---------------------------------
-def verifica_presos_folha_anterior(df_folha_atual, df_delegacias):
-    '''
-    Funcao que verifica se na pagina atual do PDF exitem presos da delegacia da pagina anterior
-    :param df_folha_atual: TabulaDataFrame da pagina atual
-    :param df_delegacias: Series das delegacias da pagina atual
-    :return: -1 ou index do totalizados de presos
-    '''
-
-    str_total_presos = df_folha_atual.iloc[:, 0].where(
-        df_folha_atual.iloc[:, 0].str.contains('^Total de presos para escolta na Delegacia', na=False)).dropna()
+def abre_tabela_rotas(args):
+    from rotas import TabelaRotas, TABELA_ROTAS
 
-    presos_folha_anterior = -1
-    for idx_total in str_total_presos.index.tolist():
-        if idx_total < df_delegacias.index.min():
-            presos_folha_anterior = idx_total
+    # Mapeamento das delegacias em postos (dp) e rotas
+    return TabelaRotas(args.tabela_rotas or TABELA_ROTAS)
 
-    return presos_folha_anterior
 
-
-def trata_df_pdf(dfs_list):
+def le_presos(args, tabela_rotas, etapa):
     '''
-    Funcao para tratar uma lista de dataframes criada pela bibliteca tabula
-    :param dfs_list: tabula DataFrame List
-    :return: DataFrame List
+    Gerador dos presos do PDF, já com a delegacia, o posto (dp) e a rota
+    :param etapa: context manager de medição das etapas (Metricas.etapa ou nullcontext)
+    :return: gerador de dicts, um por preso, na ordem do PDF
     '''
-    dfs = dfs_list
-    df_delegacias = []
-
-    for i in range(len(dfs)):
-
-        dfs[i].columns = ['nome_preso', 'nome_mae', 'dt_nascimento', 'ocorrencia', 'dt_cadastro']
-        dfs[i]['delegacia'] = nan
-        df_delegacias.append(dfs[i].iloc[:,0].where(dfs[i].iloc[:, 0].str.contains('^Delegacia', na=False)).dropna())
-
-        if len(df_delegacias[i]) > 0:
-
-            pfa = verifica_presos_folha_anterior(dfs[i], df_delegacias[i])  # presos da folha anterior
-            if pfa > -1:
-                dfs[i].iloc[:pfa, 5] = df_delegacias[i-1].iloc[-1].split(' : ')[1]
-
-            idx_del = df_delegacias[i].index.to_list()
-            lista = iter(idx_del)
-            primeiro = next(lista, 'fim')
-            while True:
-                next_val = next(lista, 'fim')
-                if next_val == 'fim':
-                    dfs[i].iloc[primeiro:, 5] = df_delegacias[i][primeiro].split(' : ')[1]
-                    break
-                else:
-                    dfs[i].iloc[primeiro:next_val, 5] = df_delegacias[i][primeiro].split(' : ')[1]
-                    primeiro = next_val
+    from sispen import extrai_pdf, extrai_presos_stream, trata_df_pdf
+
+    cache_paginas = None
+    if not args.sem_cache_paginas:
+        from cache_paginas import CachePaginas
+        cache_paginas = CachePaginas(args.cache_paginas)
+
+    try:
+        colunas = args.colunas_pdf
+        if colunas is None:
+            from leiaute_pdf import colunas_do_pdf
+            with etapa('leiaute_pdf'):
+                colunas = colunas_do_pdf(args.pdf, args.leiautes_pdf)
+
+        if getattr(args, 'stream', False):
+            # Cada preso é entregue para consulta assim que a sua página é tratada
+            yield from extrai_presos_stream(args.pdf, columns=colunas, mapeia=tabela_rotas.mapeia,
+                                            cache_paginas=cache_paginas)
         else:
-            dfs[i].iloc[:, 5] = df_delegacias[i-1].iloc[-1].split(' : ')[1]
-
-        dfs[i] = dfs[i].loc[dfs[i]['nome_preso'] != 'Nome do Preso']
-        dfs[i].dropna(inplace=True)
-
-        # trantando as colunas
-        dfs[i]['nome_preso'] = dfs[i]['nome_preso'].str.strip()
+            with etapa('extracao_pdf'):
+                tab_dfs = extrai_pdf(args.pdf, columns=colunas, n_workers=args.pdf_workers,
+                                     cache_paginas=cache_paginas)
+            with etapa('tratamento_pdf'):
+                df_final = tabela_rotas.mapeia(trata_df_pdf(tab_dfs))
+            yield from df_final.to_dict(orient='records')
+    finally:
+        if cache_paginas is not None:
+            print(cache_paginas.resumo(), end='\n')
+            cache_paginas.fecha()
+
+
+def executa_pdf(args):
+    '''
+    Modo pdf: lê e trata o PDF, exibindo a quantidade de presos de cada rota e posto
+    '''
+    from contextlib import nullcontext
+    import pandas as pd
 
-    return dfs
+    tabela_rotas = abre_tabela_rotas(args)
+    df_final = pd.DataFrame(list(le_presos(args, tabela_rotas, nullcontext)))
+    tabela_rotas.relata_desconhecidas()
+    if len(df_final) == 0:
+        print('Nenhum preso encontrado no PDF', end='\n')
+        return
 
+    rotas = args.rotas.split(',')
+    df_final = df_final.loc[df_final['rota'].isin(rotas)].drop(columns=['nome_norm', 'mae_norm'])
+    print(df_final.groupby(['rota', 'dp'], sort=True).size().rename('presos').to_string(), end='\n')
+    print('Total de presos nas rotas {}: {}'.format(','.join(rotas), len(df_final)), end='\n')
+    if args.saida:
+        df_final.to_csv(args.saida, index=False)
+        print('Arquivo criado:    {}'.format(args.saida), end='\n')
 
-tab_dfs = tabula.read_pdf(pdf_path, columns=[300, 500, 600, 700, 800, 900], guess=False, pages='all')
-df_tratados = trata_df_pdf(tab_dfs)
-df_final = pd.concat(df_tratados, ignore_index=True)
 
 # ---------------------------------
-# Tratando o World
+# Iniciando consulta ao BNMP
 # ---------------------------------
-document = MailMerge(template)
-
-# Setando os valores no cabeçalho do documento
-document.merge(
-    nome_agente=agente,
-    matr_agente=matricula,
-    equipe=delivery,
-    date_doc=data_plantao)
-
-# Setando o dicionario de rotas
-rotas = {
-    'leste': ['p05', 'p06', 'p13', 'p16', 'p30'],
-    'oeste': ['p12', 'p15', 'p21', 'p26'],
-    'sul': ['p01', 'p20', 'p27']
-}
-
-# Criando dicionario de listas de nomes de cada DP
-conteudo = {}
-
-# Criando as chaves com os nomes de cada DP
-for p in range(1, 40):
-    chave = 'p0' + str(p) if p < 10 else 'p' + str(p)
-    conteudo[chave] = []
-
-# Preenchendo cada chave com a lista dos nomes dos presos de cada DP
-# conforme regra de negocio
-lst_delegacias = df_final['delegacia'].unique().tolist()
-for delegacia in lst_delegacias:
-
-    if delegacia == '1a DP':
-        conteudo['p01'] = conteudo['p01'] + df_final.query('delegacia == "1a DP"')['nome_preso'].tolist()
-
-    elif delegacia == '4a DP':
-        conteudo['p01'] = conteudo['p01'] + df_final.query('delegacia == "4a DP"')['nome_preso'].tolist()
-
-    elif delegacia == '5a DP':
-        conteudo['p05'] = conteudo['p05'] + df_final.query('delegacia == "5a DP"')['nome_preso'].tolist()
-
-    elif delegacia == '6a DP':
-        conteudo['p06'] = conteudo['p06'] + df_final.query('delegacia == "6a DP"')['nome_preso'].tolist()
-
-    elif delegacia == '8a DP':
-        conteudo['p01'] = conteudo['p01'] + df_final.query('delegacia == "8a DP"')['nome_preso'].tolist()
-
-    elif delegacia == '10a DP':
-        conteudo['p01'] = conteudo['p01'] + df_final.query('delegacia == "10a DP"')['nome_preso'].tolist()
-
-    elif delegacia == '11a DP':
-        conteudo['p21'] = conteudo['p21'] + df_final.query('delegacia == "11a DP"')['nome_preso'].tolist()
-
-    elif delegacia == '12a DP':
-        conteudo['p12'] = conteudo['p12'] + df_final.query('delegacia == "12a DP"')['nome_preso'].tolist()
-
-    elif delegacia == '13a DP':
-        conteudo['p13'] = conteudo['p13'] + df_final.query('delegacia == "13a DP"')['nome_preso'].tolist()
-
-    elif delegacia == '14a DP':
-        conteudo['p20'] = conteudo['p20'] + df_final.query('delegacia == "14a DP"')['nome_preso'].tolist()
-
-    elif delegacia == '15a DP':
-        conteudo['p15'] = conteudo['p15'] + df_final.query('delegacia == "15a DP"')['nome_preso'].tolist()
-
-    elif delegacia == '16a DP':
-        conteudo['p16'] = conteudo['p16'] + df_final.query('delegacia == "16a DP"')['nome_preso'].tolist()
-
-    elif delegacia == '17a DP':
-        conteudo['p12'] = conteudo['p12'] + df_final.query('delegacia == "17a DP"')['nome_preso'].tolist()
-
-    elif delegacia == '18a DP':
-        conteudo['p15'] = conteudo['p15'] + df_final.query('delegacia == "18a DP"')['nome_preso'].tolist()
-
-    elif delegacia == '19a DP':
-        conteudo['p15'] = conteudo['p15'] + df_final.query('delegacia == "19a DP"')['nome_preso'].tolist()
-
-    elif delegacia == '20a DP':
-        conteudo['p20'] = conteudo['p20'] + df_final.query('delegacia == "20a DP"')['nome_preso'].tolist()
-
-    elif delegacia == '21a DP':
-        conteudo['p21'] = conteudo['p21'] + df_final.query('delegacia == "21a DP"')['nome_preso'].tolist()
-
-    elif delegacia == '23a DP':
-        conteudo['p15'] = conteudo['p15'] + df_final.query('delegacia == "23a DP"')['nome_preso'].tolist()
-
-    elif delegacia == '26a DP':
-        conteudo['p26'] = conteudo['p26'] + df_final.query('delegacia == "26a DP"')['nome_preso'].tolist()
-
-    elif delegacia == '27a DP':
-        conteudo['p27'] = conteudo['p27'] + df_final.query('delegacia == "27a DP"')['nome_preso'].tolist()
-
-    elif delegacia == '29a DP':
-        conteudo['p27'] = conteudo['p27'] + df_final.query('delegacia == "29a DP"')['nome_preso'].tolist()
-
-    elif delegacia == '30a DP':
-        conteudo['p30'] = conteudo['p30'] + df_final.query('delegacia == "30a DP"')['nome_preso'].tolist()
-
-    elif delegacia == '31a DP':
-        conteudo['p16'] = conteudo['p16'] + df_final.query('delegacia == "31a DP"')['nome_preso'].tolist()
+def sem_consulta(nome_preso: str, nome_mae: str):
+    '''
+    Substitui a consulta ao BNMP no modo word: o campo BNMP é preenchido com 'NC'
+    :return: concurrent.futures.Future já resolvido
+    '''
+    from concurrent.futures import Future
 
-    elif delegacia == '32a DP':
-        conteudo['p26'] = conteudo['p26'] + df_final.query('delegacia == "32a DP"')['nome_preso'].tolist()
+    futuro = Future()
+    futuro.set_result('NC')
+    return futuro
 
-    elif delegacia == '33a DP':
-        conteudo['p20'] = conteudo['p20'] + df_final.query('delegacia == "33a DP"')['nome_preso'].tolist()
 
-    elif delegacia == '35a DP':
-        conteudo['p13'] = conteudo['p13'] + df_final.query('delegacia == "35a DP"')['nome_preso'].tolist()
+class Recursos:
+    '''
+    Recursos caros de abrir — modelos Word compilados, cache e sessões do BNMP (navegadores com o captcha já
+    validado ou cliente da API) — reaproveitados entre as execuções de um mesmo processo (ver servidor.py)
+    '''
 
-    elif delegacia == 'DEAM II':
-        conteudo['p15'] = conteudo['p15'] + df_final.query('delegacia == "DEAM II"')['nome_preso'].tolist()
+    def __init__(self):
+        self.modelos = {}
+        self.cache = None
+        self.pool = None
+        self.agendador = None
+        self.metricas = None
+        self.opcoes = None
+
+    def modelo(self, caminho):
+        '''
+        :return: ModeloDocx do arquivo, compilado uma vez enquanto o arquivo não for alterado
+        '''
+        from modelo_docx import ModeloDocx
+
+        chave = (path.abspath(caminho), path.getmtime(caminho))
+        if chave not in self.modelos:
+            self.modelos[chave] = ModeloDocx(caminho)
+        return self.modelos[chave]
+
+    @staticmethod
+    def opcoes_consulta(args) -> tuple:
+        '''
+        Funcao que reúne as opções com que o cache e as sessões do BNMP são abertos (o cache pelo caminho absoluto,
+        pois cada trabalho do servidor roda no diretório do seu cliente)
+        :return: tupla comparável entre dois trabalhos
+        '''
+        if args.bnmp_backend == 'api':
+            sessoes = (args.bnmp_concorrencia, args.bnmp_api_url)
+        else:
+            sessoes = (args.bnmp_workers,)
+        return (path.abspath(args.cache), args.cache_ttl, args.cache_max, args.bnmp_backend, sessoes,
+                args.bnmp_taxa, args.bnmp_tentativas, args.bnmp_latencia_alvo, args.bnmp_timeout_max,
+                args.chromedriver)
+
+    def consultas(self, args, metricas, etapa):
+        '''
+        Funcao que abre o cache e o pool (navegadores) ou o cliente da API do BNMP, reaproveitando os já abertos
+        quando o trabalho usa as mesmas opções e ainda há sessões disponíveis; senão eles são fechados e reabertos
+        :return: tupla (cache, pool)
+        '''
+        self.metricas = metricas
+        opcoes = self.opcoes_consulta(args)
+        if self.pool is not None:
+            if opcoes != self.opcoes:
+                print('Opcoes do BNMP diferentes das sessoes abertas: reabrindo o cache e as sessoes', end='\n')
+                self.encerra()
+            elif not self.pool.disponivel():
+                print('Nenhuma sessao do BNMP disponivel: reabrindo as sessoes', end='\n')
+                self.encerra()
+        if self.pool is not None:
+            if hasattr(self.pool, 'metricas'):
+                self.pool.metricas = metricas
+            self.agendador.metricas = metricas
+            self.cache.atualiza = args.atualiza_cache
+            return self.cache, self.pool
+
+        from functools import partial
+        from agendador import AgendadorBNMP
+        from bnmp import abre_sessao_bnmp, scrapy_bnmp
+        from cache_bnmp import CacheBNMP
+
+        self.cache = CacheBNMP(path.abspath(args.cache), ttl_horas=args.cache_ttl, max_registros=args.cache_max,
+                               atualiza=args.atualiza_cache)
+        abre_sessao = partial(abre_sessao_bnmp, executable_path=args.chromedriver) if args.chromedriver \
+            else abre_sessao_bnmp
+
+        # Ritmo, concorrência, timeout e novas tentativas das consultas que não estão no cache
+        agendador = partial(AgendadorBNMP, taxa=args.bnmp_taxa, tentativas=args.bnmp_tentativas,
+                            latencia_alvo=args.bnmp_latencia_alvo, timeout_maximo=args.bnmp_timeout_max,
+                            metricas=metricas)
+
+        if args.bnmp_backend == 'api':
+            from bnmp_api import ClienteBNMP, URL_API, erro_transitorio
+
+            # O navegador é usado apenas para o operador validar o captcha; as consultas seguem por HTTP
+            with etapa('sessao_bnmp'):
+                driver = abre_sessao()
+            self.agendador = agendador(teto=args.bnmp_concorrencia, e_transitorio=erro_transitorio)
+            self.pool = ClienteBNMP.da_sessao(driver, url=args.bnmp_api_url or URL_API,
+                                              concorrencia=args.bnmp_concorrencia, cache=self.cache, metricas=metricas,
+                                              agendador=self.agendador)
+            driver.quit()
+        else:
+            from bnmp import erro_transitorio
+            from pool_bnmp import PoolBNMP
 
-# Excluindo as chaves que ficaram vazias
-delete = [key for key in conteudo if len(conteudo[key]) == 0]
-for key in delete: del conteudo[key]
+            # Com vários navegadores, o agendador decide quantos pesquisam ao mesmo tempo
+            self.agendador = agendador(teto=args.bnmp_workers, e_transitorio=erro_transitorio)
 
-# Preenchendo o documento Word modelo com o conteudo dos nomes dos presos de cada DP,
-# conforme as rotas indicadas
-for rota in route_name:
+            def consulta(drv, nome_preso, nome_mae):
+                return self.agendador.executa(partial(scrapy_bnmp, metricas=self.metricas), drv, nome_preso, nome_mae)
 
-    for delegacia in rotas[rota]:
-        merge_content = []
-        if delegacia in conteudo:
+            self.pool = PoolBNMP(abre_sessao, partial(self.cache.consulta, consulta), n_sessoes=args.bnmp_workers)
+        self.opcoes = opcoes
+        return self.cache, self.pool
 
-            for i in range(len(conteudo[delegacia])):
-                dict_content = {
-                    str(delegacia) + '_idx': '0' + str(i + 1) if (i + 1) < 10 else str(i + 1),
-                    str(delegacia) + '_nome': conteudo[delegacia][i],
-                    str(delegacia) + '_ip': '',
-                    str(delegacia) + '_mp': 'NÃO',
-                    str(delegacia) + '_mlj': 'NÃO',
-                    str(delegacia) + '_cs': 'NÃO',
-                    str(delegacia) + '_bnmp': 'NC'
-                }
-                merge_content.append(dict_content)
+    def encerra(self):
+        '''
+        Fecha os navegadores (ou o cliente da API) e o cache
+        '''
+        if self.pool is not None:
+            self.pool.encerra()
+            self.cache.fecha()
+            self.pool = self.cache = self.agendador = self.opcoes = None
 
-            document.merge_rows(str(delegacia) + '_idx', merge_content)
-            # print(merge_content, end='\n\n')
 
-document.write('./{:%d.%m.%Y}.docx'.format(date.today()))
-print('\nExecucao finalizada com sucesso!', end='\n')
-print('Arquivo criado:    {:%d.%m.%Y}.docx'.format(date.today()), end='\n')
\ No newline at end of file
+# ---------------------------------
+# Preenchendo o documento Word
+# ---------------------------------
+def executa_documentos(args, recursos=None) -> list:
+    '''
+    Modos word e bnmp: lê o PDF, consulta os presos das rotas (modo bnmp) e preenche um documento por trabalho
+    :param recursos: Recursos já abertos, mantidos ao final (sem ele os recursos são abertos e fechados aqui)
+    :return: lista dos arquivos gerados
+    '''
+    from contextlib import nullcontext
+    import asyncio
+    from metricas import Metricas
+    from pipeline import PipelineEscolta
+
+    proprios = recursos is None
+    if proprios:
+        recursos = Recursos()
+
+    # Métricas da execução (None quando não pedidas)
+    if args.profile or args.metrics_out or args.profile_memoria:
+        metricas = Metricas(memoria='tracemalloc' if args.profile_memoria else 'rss')
+    else:
+        metricas = None
+    etapa = metricas.etapa if metricas is not None else nullcontext
+
+    trabalhos, route_name = monta_trabalhos(args)
+    tabela_rotas = abre_tabela_rotas(args)
+    data_plantao = '{:%d/%m/%Y}'.format(date.today())
+
+    with etapa('compilacao_modelo'):
+        document = recursos.modelo(args.model)
+
+    cache = None
+    diario = None
+    em_andamento = None
+    if args.modo == 'bnmp':
+        from diario import DiarioConsultas
+
+        cache, pool = recursos.consultas(args, metricas, etapa)
+        # Cada consulta concluída é gravada no diário da execução, retomado com --retoma depois de uma queda
+        diario = DiarioConsultas.da_execucao(args.pdf, route_name, args.diario, retoma=args.retoma)
+        submete = diario.envolve(pool.submete)
+        # Poucas consultas enviadas além das que o BNMP atende ao mesmo tempo: as demais seguem a prioridade
+        em_andamento = 2 * (args.bnmp_concorrencia if args.bnmp_backend == 'api' else args.bnmp_workers)
+    else:
+        submete = sem_consulta
+
+    # Preenchendo o documento Word modelo de cada trabalho com as DPs das suas rotas
+    arquivos_pendentes = []
+
+    def gera_documento(trabalho, linhas_dp):
+        cabecalho = dict(
+            nome_agente=trabalho['agente'],
+            matr_agente=trabalho['matricula'],
+            equipe=trabalho['equipe'],
+            date_doc=data_plantao)
+        with etapa('renderizacao'):
+            document.renderiza(trabalho['saida'], cabecalho, linhas_dp)
+        # Uma única escrita: os documentos são gravados em threads simultâneas
+        sys.stdout.write('Documento gravado: {} (rotas {})\n'.format(path.basename(trabalho['saida']),
+                                                                     ','.join(trabalho['rotas'])))
+        pendentes = pipeline.presos_pendentes(linhas_dp)
+        if len(pendentes) > 0:
+            arquivos_pendentes.append(grava_pendentes(trabalho['saida'], pendentes))
+
+    # Leitura do PDF, consultas dos presos das rotas indicadas e geração dos documentos sobrepostas em um pipeline:
+    # as linhas de cada DP mantêm a ordem do PDF e o mesmo preso listado mais de uma vez (em outra delegacia ou
+    # repetido na quebra de página) é consultado uma única vez, com o resultado repetido nas linhas.
+    # Cada documento é gravado assim que as consultas das DPs das suas rotas terminam.
+    pipeline = PipelineEscolta(submete, route_name, trabalhos=list(trabalhos), gera_documento=gera_documento,
+                               metricas=metricas, prazo_consulta=args.prazo_consulta,
+                               prazo_total=args.prazo_total * 60 if args.prazo_total else None,
+                               postos_por_rota=tabela_rotas.postos_por_rota(), em_andamento=em_andamento,
+                               guarda_registros=not args.sem_historico,
+                               leitura_incremental=getattr(args, 'stream', False))
+    with etapa('pipeline'):
+        asyncio.run(pipeline.executa(le_presos(args, tabela_rotas, etapa)))
+    tabela_rotas.relata_desconhecidas()
+    if diario is not None:
+        # Com presos pendentes o diário fica para uma nova execução com --retoma
+        diario.fecha(descarta=not any(pipeline.pendentes_dp.values()))
+
+    if not args.sem_historico:
+        try:
+            from historico import arquiva
+        except ImportError:
+            print('Arquivo historico nao gravado: instale o pyarrow', end='\n')
+        else:
+            with etapa('historico'):
+                arquivo_historico = arquiva(pipeline.registros(), args.historico)
+            print('Presos acrescentados ao historico: {}'.format(arquivo_historico), end='\n')
+
+    if cache is not None:
+        print('Consultas evitadas por presos repetidos na lista: {}'.format(pipeline.repetidos), end='\n')
+        print(cache.resumo(), end='\n')
+        print(recursos.agendador.resumo(), end='\n')
+        if args.retoma:
+            print(diario.resumo(), end='\n')
+
+    if metricas is not None:
+        if cache is not None:
+            metricas.define('cache_acertos', cache.acertos)
+            metricas.define('cache_consultas_realizadas', cache.falhas)
+        arquivo_metricas = args.metrics_out or path.splitext(trabalhos[0]['saida'])[0] + '.metricas.json'
+        metricas.grava(arquivo_metricas)
+        print('Metricas gravadas em: {}'.format(arquivo_metricas), end='\n')
+
+    if proprios:
+        recursos.encerra()
+
+    print('\nExecucao finalizada com sucesso!', end='\n')
+    arquivos = [trabalho['saida'] for trabalho in trabalhos] + arquivos_pendentes
+    for arquivo in arquivos:
+        print('Arquivo criado:    {}'.format(path.basename(arquivo)), end='\n')
+    return arquivos
+
+
+def grava_pendentes(saida, presos) -> str:
+    '''
+    Funcao que grava, ao lado do documento, a lista dos presos cuja consulta ao BNMP ficou pendente
+    :param saida: caminho do documento gerado
+    :param presos: lista de dicts dos presos pendentes
+    :return: caminho do arquivo gravado (dd.mm.aaaa.pendentes.txt)
+    '''
+    caminho = path.splitext(saida)[0] + '.pendentes.txt'
+    with open(caminho, 'w', encoding='utf-8') as arq:
+        arq.write('Presos com a consulta ao BNMP pendente ({}):\n\n'.format(len(presos)))
+        for preso in presos:
+            arq.write('{} | {} | {} | Mae: {}\n'.format(preso['dp'], preso['delegacia'], preso['nome_preso'],
+                                                       preso['nome_mae']))
+    print('Consultas pendentes: {} (lista em {})'.format(len(presos), path.basename(caminho)), end='\n')
+    return caminho
+
+
+def main(argv=None):
+    args = le_argumentos(argv)
+    if args.modo == 'pdf':
+        executa_pdf(args)
+    else:
+        executa_documentos(args)
+
+
+if __name__ == '__main__':
+    main()
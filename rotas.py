@@ -0,0 +1,58 @@
+'''
+Tabela de mapeamento delegacia -> posto (dp) -> rota, lida do arquivo rotas.csv.
+
+Para incluir uma delegacia, um posto ou uma rota basta acrescentar uma linha no CSV; a ordem das linhas define
+a ordem dos postos dentro de cada rota.
+'''
+from os import path
+
+import numpy as np
+import pandas as pd
+
+TABELA_ROTAS = path.join(path.dirname(path.abspath(__file__)), 'rotas.csv')
+
+
+class TabelaRotas:
+    '''
+    Mapeamento das delegacias em postos e rotas, aplicado como um único mapa categórico sobre a coluna 'delegacia'
+    :param caminho: caminho do CSV com as colunas delegacia, posto e rota
+    '''
+
+    def __init__(self, caminho=TABELA_ROTAS):
+        self.caminho = caminho
+        self.tabela = pd.read_csv(caminho, dtype=str).apply(lambda coluna: coluna.str.strip())
+        duplicadas = self.tabela['delegacia'][self.tabela['delegacia'].duplicated()].tolist()
+        if len(duplicadas) > 0:
+            raise ValueError('Delegacias repetidas em {}: {}'.format(caminho, ', '.join(duplicadas)))
+
+        self.delegacias = pd.Index(self.tabela['delegacia'])
+        # O código -1 (delegacia fora da tabela) cai na última posição, com None
+        self.postos = np.append(self.tabela['posto'].values.astype(object), None)
+        self.rotas = np.append(self.tabela['rota'].values.astype(object), None)
+        self.desconhecidas = set()
+
+    def mapeia(self, df):
+        '''
+        Cria as colunas 'dp' (posto) e 'rota' a partir da coluna 'delegacia', em uma única passada
+        :param df: DataFrame de presos tratado por trata_df_pdf
+        :return: DataFrame
+        '''
+        codigos = pd.Categorical(df['delegacia'], categories=self.delegacias).codes
+        df['dp'] = self.postos[codigos]
+        df['rota'] = self.rotas[codigos]
+        self.desconhecidas.update(df['delegacia'][codigos == -1].unique().tolist())
+        return df
+
+    def postos_por_rota(self) -> dict:
+        '''
+        :return: dict {rota: [postos na ordem da tabela]}
+        '''
+        return {rota: list(dict.fromkeys(grupo['posto'])) for rota, grupo in self.tabela.groupby('rota', sort=False)}
+
+    def relata_desconhecidas(self):
+        '''
+        Informa as delegacias encontradas no PDF que não constam na tabela (os presos delas ficam fora do documento)
+        '''
+        if len(self.desconhecidas) > 0:
+            print('Atencao: delegacias sem posto cadastrado em {}: {}'.format(
+                self.caminho, ', '.join(sorted(str(d) for d in self.desconhecidas))), end='\n')
@@ -0,0 +1,225 @@
+'''
+Servidor local que mantém aquecidos os recursos caros do popula_modelo.py e recebe os trabalhos de um cliente.
+
+A cada execução do script são pagos a JVM do tabula, a abertura do Chrome com a validação do captcha e a
+compilação do modelo Word. O servidor abre esses recursos uma vez — os navegadores (ou o cliente da API) do BNMP
+na partida, o modelo já compilado e a JVM do tabula (carregada no próprio processo pelo jpype, tabula-py >= 2.3)
+na primeira leitura — e processa os trabalhos seguintes do dia reaproveitando-os. Os trabalhos são executados
+um de cada vez, com os mesmos argumentos do popula_modelo.py.
+
+Como um trabalho lê e grava arquivos no diretório indicado pelo cliente, o servidor só atende quem tem acesso ao
+token sorteado na partida e gravado em um arquivo legível apenas pelo usuário (~/.escolta-servidor-<porta>.token);
+o cliente lê o arquivo e envia o token junto com cada pedido.
+
+Exemplos:
+    python servidor.py inicia --model modelo.docx --bnmp-backend api
+    python servidor.py envia bnmp -r sul,leste --pdf solicitacoes.pdf --model modelo.docx -c 1
+    python servidor.py encerra
+'''
+from __future__ import print_function
+from contextlib import nullcontext
+from os import path
+from time import perf_counter
+import argparse
+import hmac
+import json
+import os
+import secrets
+import socket
+import socketserver
+import sys
+import threading
+import traceback
+import tracemalloc
+
+from popula_modelo import Recursos, adiciona_opcoes_bnmp, executa_documentos, executa_pdf, le_argumentos
+
+PORTA = 8765
+ARQUIVO_TOKEN = path.join(path.expanduser('~'), '.escolta-servidor-{}.token')
+
+
+def grava_token(porta) -> str:
+    '''
+    Funcao que sorteia o token do servidor e o grava em um arquivo criado com permissão apenas para o usuário
+    :param porta: porta local do servidor (um arquivo por porta)
+    :return: str com o token
+    '''
+    token = secrets.token_hex(32)
+    caminho = ARQUIVO_TOKEN.format(porta)
+    if path.exists(caminho):
+        os.remove(caminho)  # recriado para que a permissão 0o600 valha também para o arquivo de um servidor anterior
+    with os.fdopen(os.open(caminho, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w') as arq:
+        arq.write(token)
+    return token
+
+
+def le_token(porta) -> str:
+    '''
+    Funcao do cliente: lê o token gravado pelo servidor na partida
+    :return: str com o token
+    '''
+    try:
+        with open(ARQUIVO_TOKEN.format(porta)) as arq:
+            return arq.read().strip()
+    except FileNotFoundError:
+        print('Erro: servidor nao iniciado na porta {} (token inexistente)'.format(porta), end='\n')
+        sys.exit(1)
+
+
+class ServidorEscolta(socketserver.ThreadingTCPServer):
+    '''
+    Servidor TCP em localhost; cada conexão envia um pedido JSON (uma linha) e recebe a resposta JSON
+    :param porta: porta local
+    :param recursos: Recursos compartilhados entre os trabalhos
+    :param token: token exigido em cada pedido
+    '''
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, porta, recursos, token):
+        super().__init__(('127.0.0.1', porta), Atendimento)
+        self.recursos = recursos
+        self.token = token
+        self.lock = threading.Lock()  # um trabalho por vez: as sessões do BNMP e o diretório são compartilhados
+
+    def executa(self, pedido) -> dict:
+        '''
+        Executa um trabalho com os argumentos do popula_modelo.py, no diretório do cliente
+        :param pedido: dict {'argv': [...], 'cwd': diretório do cliente}
+        :return: dict {'ok': bool, 'arquivos': [...], 'segundos': float} ou {'ok': False, 'erro': str}
+        '''
+        with self.lock:
+            anterior = os.getcwd()
+            inicio = perf_counter()
+            try:
+                os.chdir(pedido.get('cwd') or anterior)
+                args = le_argumentos(pedido['argv'])
+                args.cabecalho = False  # o cliente já perguntou e enviou --agente, --matricula e --equipe
+                if args.modo == 'pdf':
+                    executa_pdf(args)
+                    arquivos = [args.saida] if args.saida else []
+                else:
+                    arquivos = executa_documentos(args, self.recursos)
+                return {'ok': True, 'arquivos': [os.path.abspath(arquivo) for arquivo in arquivos],
+                        'segundos': perf_counter() - inicio}
+            except SystemExit as e:
+                return {'ok': False, 'erro': 'Argumentos invalidos (codigo {})'.format(e.code)}
+            except Exception as e:
+                traceback.print_exc()
+                return {'ok': False, 'erro': '{}: {}'.format(type(e).__name__, e)}
+            finally:
+                os.chdir(anterior)
+                # Um trabalho com --profile interrompido por erro não chega a Metricas.grava
+                if tracemalloc.is_tracing():
+                    tracemalloc.stop()
+
+
+class Atendimento(socketserver.StreamRequestHandler):
+
+    def autorizado(self, pedido) -> bool:
+        token = pedido.get('token') if isinstance(pedido, dict) else None
+        return isinstance(token, str) and hmac.compare_digest(token.encode('utf-8'),
+                                                              self.server.token.encode('utf-8'))
+
+    def handle(self):
+        try:
+            pedido = json.loads(self.rfile.readline().decode('utf-8'))
+        except ValueError:
+            pedido = None
+        if not self.autorizado(pedido):
+            resposta = {'ok': False, 'erro': 'Pedido recusado: token ausente ou invalido'}
+        elif pedido.get('comando') == 'encerra':
+            resposta = {'ok': True}
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+        else:
+            print('Trabalho recebido: {}'.format(' '.join(pedido.get('argv', []))), end='\n')
+            resposta = self.server.executa(pedido)
+        self.wfile.write((json.dumps(resposta) + '\n').encode('utf-8'))
+
+
+def envia(pedido, porta=PORTA) -> dict:
+    '''
+    Funcao do cliente: envia um pedido ao servidor, com o token da partida, e aguarda a resposta
+    :return: dict com a resposta
+    '''
+    pedido = dict(pedido, token=le_token(porta))
+    with socket.create_connection(('127.0.0.1', porta)) as conexao:
+        conexao.sendall((json.dumps(pedido) + '\n').encode('utf-8'))
+        with conexao.makefile('rb') as resposta:
+            return json.loads(resposta.readline().decode('utf-8'))
+
+
+def inicia(args):
+    recursos = Recursos()
+
+    # Aquece o que for possível antes do primeiro trabalho
+    import sispen  # noqa: F401 (pandas, tabula)
+    if args.model:
+        recursos.modelo(args.model)
+    if not args.sem_bnmp:
+        recursos.consultas(args, None, nullcontext)
+
+    # O token é gravado depois de ocupar a porta: uma segunda partida na mesma porta falha sem trocá-lo
+    servidor = ServidorEscolta(args.porta, recursos, None)
+    servidor.token = grava_token(args.porta)
+    print('Servidor aguardando trabalhos em 127.0.0.1:{}'.format(args.porta), end='\n')
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        os.remove(ARQUIVO_TOKEN.format(args.porta))
+        recursos.encerra()
+    print('Servidor encerrado', end='\n')
+
+
+def cliente(args):
+    argv = list(args.argumentos)
+    if len(argv) > 0 and argv[0] == '--':
+        argv = argv[1:]
+
+    # Validação local (rápida) dos argumentos e perguntas do cabeçalho feitas no terminal do cliente
+    local = le_argumentos(argv)
+    if getattr(local, 'cabecalho', False):
+        argv += ['--agente', input('Insira o nome do Agente: '),
+                 '--matricula', input('Insira a matricula do Agente: '),
+                 '--equipe', input('Insira o num. da equipe: ')]
+
+    resposta = envia({'argv': argv, 'cwd': os.getcwd()}, args.porta)
+    if not resposta['ok']:
+        print('Erro no servidor: {}'.format(resposta['erro']), end='\n')
+        sys.exit(1)
+    print('\nExecucao finalizada com sucesso! ({:.1f} s)'.format(resposta['segundos']), end='\n')
+    for arquivo in resposta['arquivos']:
+        print('Arquivo criado:    {}'.format(os.path.basename(arquivo)), end='\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Servidor local do popula_modelo: mantem a JVM do tabula, as '
+                                                 'sessoes do BNMP e o modelo Word compilado entre os trabalhos')
+    comandos = parser.add_subparsers(dest='comando')
+
+    p_inicia = comandos.add_parser('inicia', help="inicia o servidor")
+    p_inicia.add_argument("--porta", type=int, default=PORTA, help="porta local do servidor")
+    p_inicia.add_argument("--model", help="modelo Word compilado na partida")
+    p_inicia.add_argument("--sem-bnmp", action='store_true',
+                          help="nao abre as sessoes do BNMP na partida (abertas no primeiro trabalho do modo bnmp)")
+    adiciona_opcoes_bnmp(p_inicia)
+
+    p_envia = comandos.add_parser('envia', help="envia um trabalho (argumentos do popula_modelo.py) ao servidor")
+    p_envia.add_argument("--porta", type=int, default=PORTA, help="porta local do servidor")
+    p_envia.add_argument("argumentos", nargs=argparse.REMAINDER, help="argumentos do popula_modelo.py")
+
+    p_encerra = comandos.add_parser('encerra', help="encerra o servidor")
+    p_encerra.add_argument("--porta", type=int, default=PORTA, help="porta local do servidor")
+
+    args = parser.parse_args()
+    if args.comando == 'inicia':
+        inicia(args)
+    elif args.comando == 'envia':
+        cliente(args)
+    elif args.comando == 'encerra':
+        envia({'comando': 'encerra'}, args.porta)
+    else:
+        parser.print_help()
@@ -0,0 +1,203 @@
+'''
+Funções de tratamento do arquivo PDF do SISPEN (lista de presos para escolta).
+'''
+from concurrent.futures import ThreadPoolExecutor
+import re
+
+import numpy as np
+import pandas as pd
+from PyPDF2 import PdfFileReader
+import tabula
+
+from cache_paginas import hash_paginas
+from normaliza import normaliza_colunas
+
+COLUNAS = ['nome_preso', 'nome_mae', 'dt_nascimento', 'ocorrencia', 'dt_cadastro']
+
+# Classificação das linhas do PDF pela primeira coluna: cabeçalho de delegacia ("Delegacia : 1a DP"),
+# totalizador ("Total de presos para escolta na Delegacia ...") ou cabeçalho da tabela ("Nome do Preso").
+# As demais linhas são dados dos presos.
+RE_TIPO_LINHA = re.compile(r'^(?:(?P<delegacia>Delegacia(?:.*? : (?P<rotulo>.*?)(?: : |$))?)'
+                           r'|(?P<total>Total de presos para escolta na Delegacia)'
+                           r'|(?P<cabecalho>Nome do Preso$))')
+
+# Marca as linhas que encerram a lista de uma delegacia, interrompendo o preenchimento para frente
+FIM_DELEGACIA = ''
+
+
+def conta_paginas(pdf_path) -> int:
+    '''
+    Funcao que retorna a quantidade de páginas do PDF
+    :param pdf_path: caminho do arquivo PDF
+    :return: int
+    '''
+    with open(pdf_path, 'rb') as arq:
+        return PdfFileReader(arq).getNumPages()
+
+
+def divide_paginas(n_paginas: int, n_partes: int) -> list:
+    '''
+    Funcao que divide as páginas 1..n_paginas em até n_partes intervalos contíguos e de tamanho parecido
+    :return: lista de listas de páginas, em ordem
+    '''
+    n_partes = max(1, min(n_partes, n_paginas))
+    tamanho, resto = divmod(n_paginas, n_partes)
+    intervalos = []
+    inicio = 1
+    for i in range(n_partes):
+        fim = inicio + tamanho + (1 if i < resto else 0)
+        intervalos.append(list(range(inicio, fim)))
+        inicio = fim
+    return intervalos
+
+
+def extrai_pdf(pdf_path, columns, n_workers=1, cache_paginas=None):
+    '''
+    Funcao que extrai as tabelas de todas as páginas do PDF com o tabula, dividindo as páginas entre extrações
+    simultâneas. Cada chamada ao tabula roda em uma JVM própria ou, com o jpype instalado, na JVM já carregada no
+    processo, que libera o GIL durante a extração; em ambos os casos threads bastam para o paralelismo.
+    :param pdf_path: caminho do arquivo PDF
+    :param columns: posições (em pontos) das divisões entre as colunas da tabela
+    :param n_workers: quantidade de extrações simultâneas
+    :param cache_paginas: CachePaginas opcional; as páginas já extraídas antes não passam de novo pelo tabula
+    :return: tabula DataFrame List, uma por página e na ordem das páginas (mesmo resultado de pages='all')
+    '''
+    if cache_paginas is not None:
+        return extrai_paginas(pdf_path, columns, list(range(1, conta_paginas(pdf_path) + 1)), n_workers,
+                              cache_paginas)
+    if n_workers <= 1:
+        return tabula.read_pdf(pdf_path, columns=columns, guess=False, pages='all')
+    return _extrai_em_partes(pdf_path, columns, list(range(1, conta_paginas(pdf_path) + 1)), n_workers)
+
+
+def _extrai_em_partes(pdf_path, columns, paginas, n_workers):
+    intervalos = [[paginas[i - 1] for i in intervalo] for intervalo in divide_paginas(len(paginas), n_workers)]
+    with ThreadPoolExecutor(max_workers=len(intervalos)) as executor:
+        partes = executor.map(lambda parte: tabula.read_pdf(pdf_path, columns=columns, guess=False, pages=parte),
+                              intervalos)
+        # A junção na ordem das páginas basta: a delegacia que continua na página seguinte é propagada
+        # por trata_df_pdf sobre as páginas concatenadas
+        return [df_pagina for parte in partes for df_pagina in parte]
+
+
+def extrai_paginas(pdf_path, columns, paginas, n_workers=1, cache_paginas=None, hashes=None):
+    '''
+    Funcao que extrai as tabelas das páginas indicadas, reaproveitando do cache as páginas sem alteração
+    :param pdf_path: caminho do arquivo PDF
+    :param columns: posições (em pontos) das divisões entre as colunas da tabela
+    :param paginas: números das páginas (a partir de 1), em ordem
+    :param n_workers: quantidade de extrações simultâneas
+    :param cache_paginas: CachePaginas opcional
+    :param hashes: hashes de todas as páginas do PDF (hash_paginas), para não recalcular a cada chamada
+    :return: tabula DataFrame List, uma por página indicada
+    '''
+    if cache_paginas is None:
+        return _extrai_em_partes(pdf_path, columns, paginas, n_workers)
+
+    if hashes is None:
+        hashes = hash_paginas(pdf_path, columns)
+    pedidas = [hashes[pagina - 1] for pagina in paginas]
+    tabelas = cache_paginas.busca(pedidas)
+    faltando = [pagina for pagina, h in zip(paginas, pedidas) if h not in tabelas]
+    if len(faltando) > 0:
+        novas = _extrai_em_partes(pdf_path, columns, faltando, n_workers)
+        if len(novas) != len(faltando):
+            # O tabula não devolveu uma tabela por página (ex.: página em branco): extrai sem o cache
+            return _extrai_em_partes(pdf_path, columns, paginas, n_workers)
+        novas = {hashes[pagina - 1]: df_pagina for pagina, df_pagina in zip(faltando, novas)}
+        cache_paginas.grava(novas)
+        tabelas.update(novas)
+
+    cache_paginas.reaproveitadas += len(paginas) - len(faltando)
+    cache_paginas.extraidas += len(faltando)
+    return [tabelas[h] for h in pedidas]
+
+
+def classifica_linhas(primeira_coluna):
+    '''
+    Funcao que classifica as linhas do PDF e extrai o nome da delegacia dos cabeçalhos
+    :param primeira_coluna: Series com a primeira coluna (nome_preso) das linhas extraidas pelo tabula
+    :return: DataFrame com as colunas 'tipo' (delegacia | total | cabecalho | dado) e 'rotulo'
+    '''
+    partes = primeira_coluna.where(primeira_coluna.map(type) == str, '').str.extract(RE_TIPO_LINHA)
+    tipo = np.select([partes['delegacia'].notna(), partes['total'].notna(), partes['cabecalho'].notna()],
+                     ['delegacia', 'total', 'cabecalho'], 'dado')
+    return pd.DataFrame({'tipo': tipo, 'rotulo': partes['rotulo'].str.strip()}, index=primeira_coluna.index)
+
+
+def rotula_delegacias(df, delegacia_inicial=None):
+    '''
+    Funcao que preenche a coluna 'delegacia' propagando o nome de cada cabeçalho de delegacia para as linhas
+    seguintes, inclusive através das quebras de página, até o totalizador da delegacia
+    :param df: DataFrame com as linhas de todas as páginas, em ordem
+    :param delegacia_inicial: delegacia em aberto no fim do trecho anterior do PDF (leitura incremental)
+    :return: tupla (DataFrame com as colunas 'delegacia' e 'tipo', delegacia em aberto na última linha ou None)
+    '''
+    linhas = classifica_linhas(df['nome_preso'])
+    rotulo = linhas['rotulo'].where(linhas['tipo'] == 'delegacia')
+    rotulo = rotulo.mask((linhas['tipo'] == 'total') | ((linhas['tipo'] == 'delegacia') & rotulo.isna()),
+                         FIM_DELEGACIA)
+    if delegacia_inicial is not None and len(rotulo) > 0 and pd.isna(rotulo.iloc[0]):
+        rotulo.iloc[0] = delegacia_inicial
+    rotulo = rotulo.ffill()
+
+    ultima = rotulo.iloc[-1] if len(rotulo) > 0 else delegacia_inicial
+    if pd.isna(ultima) or ultima == FIM_DELEGACIA:
+        ultima = None
+    return df.assign(delegacia=rotulo.replace(FIM_DELEGACIA, np.nan), tipo=linhas['tipo']), ultima
+
+
+def trata_df_pdf(dfs_list):
+    '''
+    Funcao para tratar uma lista de dataframes criada pela bibliteca tabula
+    :param dfs_list: tabula DataFrame List (uma por página, em ordem)
+    :return: DataFrame com os presos de todas as páginas
+    '''
+    return trata_paginas(dfs_list)[0]
+
+
+def trata_paginas(dfs_list, delegacia_inicial=None):
+    '''
+    Funcao que trata um trecho de páginas do PDF, continuando a delegacia em aberto no trecho anterior
+    :param dfs_list: tabula DataFrame List (uma por página, em ordem)
+    :param delegacia_inicial: delegacia em aberto no fim do trecho anterior
+    :return: tupla (DataFrame com os presos do trecho, delegacia em aberto no fim do trecho ou None)
+    '''
+    if len(dfs_list) == 0:
+        return pd.DataFrame(columns=COLUNAS + ['delegacia', 'nome_norm', 'mae_norm']), delegacia_inicial
+
+    df = pd.concat([df_pagina.set_axis(COLUNAS, axis=1) for df_pagina in dfs_list], ignore_index=True)
+    df, ultima = rotula_delegacias(df, delegacia_inicial)
+
+    df = df.loc[df['tipo'] != 'cabecalho'].drop(columns='tipo')
+    df = df.dropna(thresh=5)  # mantém as linhas que contenham pelo menos 5 valores não NaN
+    df = df.fillna('NC')
+
+    # trantando as colunas
+    df['nome_preso'] = df['nome_preso'].str.strip()
+    df = normaliza_colunas(df)
+    return df.reset_index(drop=True), ultima
+
+
+def extrai_presos_stream(pdf_path, columns, mapeia=None, paginas_por_janela=1, cache_paginas=None):
+    '''
+    Gerador que extrai e trata o PDF em janelas de páginas, entregando cada preso assim que a sua delegacia
+    (e a rota, via mapeia) é conhecida. Apenas a janela atual fica em memória.
+    :param pdf_path: caminho do arquivo PDF
+    :param columns: posições (em pontos) das divisões entre as colunas da tabela
+    :param mapeia: função opcional aplicada ao DataFrame de cada janela (ex.: criação das colunas dp e rota)
+    :param paginas_por_janela: quantidade de páginas extraídas por chamada ao tabula
+    :param cache_paginas: CachePaginas opcional; as páginas já extraídas antes não passam de novo pelo tabula
+    :return: gerador de dicts, um por preso, na ordem do PDF
+    '''
+    n_paginas = conta_paginas(pdf_path)
+    hashes = hash_paginas(pdf_path, columns) if cache_paginas is not None else None
+    delegacia = None
+    for inicio in range(1, n_paginas + 1, paginas_por_janela):
+        paginas = list(range(inicio, min(inicio + paginas_por_janela, n_paginas + 1)))
+        dfs = extrai_paginas(pdf_path, columns, paginas, cache_paginas=cache_paginas, hashes=hashes)
+        df, delegacia = trata_paginas(dfs, delegacia)
+        if mapeia is not None:
+            df = mapeia(df)
+        for registro in df.to_dict(orient='records'):
+            yield registro